@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+update.py 离线性能基准测试
+在本地启动模拟 download.docker.com 与 GitHub API 的 HTTP 服务，
+端到端运行 DockerUpdater.update()，统计耗时、请求数、传输字节数与磁盘重复读取量
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import io
+import random
+import shutil
+import tarfile
+import hashlib
+import argparse
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "packages" / "scripts"))
+
+import update  # noqa: E402
+
+
+class UpstreamState:
+    """模拟上游的配置与请求统计"""
+
+    def __init__(self, docker_version, compose_version, sizes, latency, bandwidth, fail_rate, seed):
+        self.docker_version = docker_version
+        self.compose_version = compose_version
+        self.sizes = sizes
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.fail_rate = fail_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.blobs = {}
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = {}
+            self.bytes_sent = 0
+            self.failures = 0
+
+    def count(self, endpoint, method, nbytes=0):
+        with self.lock:
+            key = f"{method} {endpoint}"
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.bytes_sent += nbytes
+
+    def should_fail(self):
+        with self.lock:
+            if self.fail_rate and self.random.random() < self.fail_rate:
+                self.failures += 1
+                return True
+            return False
+
+    def blob(self, name, size):
+        """按名称生成确定性的伪随机内容，保证多次运行校验和一致；.tgz 生成有效的 tar.gz"""
+        with self.lock:
+            if name not in self.blobs:
+                if name.endswith(".tgz"):
+                    self.blobs[name] = self.make_archive(name, size)
+                else:
+                    seed = hashlib.sha256(name.encode()).digest()
+                    block = hashlib.sha256(seed).digest() * 2048
+                    self.blobs[name] = (block * (size // len(block) + 1))[:size]
+            return self.blobs[name]
+
+    def make_archive(self, name, size):
+        """生成与上游布局一致的 tar.gz，内容不可压缩，使文件大小接近 size"""
+        prefix = "docker-rootless-extras" if "rootless" in name else "docker"
+        content = random.Random(name).getrandbits(size * 8).to_bytes(size, "little")
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w:gz", compresslevel=1) as tar:
+            directory = tarfile.TarInfo(prefix)
+            directory.type = tarfile.DIRTYPE
+            directory.mode = 0o755
+            tar.addfile(directory)
+            for index, part in enumerate((content[:size // 2], content[size // 2:])):
+                info = tarfile.TarInfo(f"{prefix}/binary{index}")
+                info.size = len(part)
+                info.mode = 0o755
+                tar.addfile(info, io.BytesIO(part))
+        return buffer.getvalue()
+
+
+class UpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.route(head=False)
+
+    def do_HEAD(self):
+        self.route(head=True)
+
+    def route(self, head):
+        if self.state.latency:
+            time.sleep(self.state.latency)
+        path = self.path.split("?")[0]
+        base = f"http://{self.headers.get('Host')}"
+        st = self.state
+
+        m = re.match(r"^/linux/static/stable/(\w+)/$", path)
+        if m:
+            versions = sorted({st.docker_version, "28.5.2", "27.5.1"})
+            links = "".join(
+                f'<a href="docker-{v}.tgz">docker-{v}.tgz</a>\n'
+                f'<a href="docker-rootless-extras-{v}.tgz">docker-rootless-extras-{v}.tgz</a>\n'
+                for v in versions
+            )
+            return self.send_metadata("static-index", f"<html><body><pre>\n{links}</pre></body></html>", "text/html", head)
+
+        m = re.match(r"^/linux/static/stable/(\w+)/(docker-rootless-extras|docker)-([\d.]+)\.tgz$", path)
+        if m:
+            kind = "rootless" if m.group(2) == "docker-rootless-extras" else "docker"
+            return self.send_blob(f"{kind}-asset", path, st.sizes[kind], head)
+
+        if path == "/repos/moby/moby/releases/latest":
+            body = json.dumps({"tag_name": f"docker-v{st.docker_version}"})
+            return self.send_metadata("github-moby-latest", body, "application/json", head)
+
+        if path == "/repos/docker/compose/releases/latest":
+            body = json.dumps({"tag_name": f"v{st.compose_version}"})
+            return self.send_metadata("github-compose-latest", body, "application/json", head)
+
+        if path == "/repos/docker/compose/releases":
+            versions = sorted({st.compose_version, "2.29.7", "2.29.1"}, key=lambda v: tuple(map(int, v.split("."))), reverse=True)
+            body = json.dumps([{"tag_name": f"v{v}", "prerelease": False, "draft": False} for v in versions])
+            return self.send_metadata("github-compose-releases", body, "application/json", head)
+
+        m = re.match(r"^/repos/docker/compose/releases/tags/v([\d.]+)$", path)
+        if m:
+            version = m.group(1)
+            assets = [
+                {
+                    "name": f"docker-compose-linux-{arch}",
+                    "browser_download_url": f"{base}/compose/releases/download/v{version}/docker-compose-linux-{arch}",
+                }
+                for arch in ("x86_64", "aarch64", "armv7")
+            ]
+            body = json.dumps({"tag_name": f"v{version}", "assets": assets})
+            return self.send_metadata("github-compose-tag", body, "application/json", head)
+
+        m = re.match(r"^/compose/releases/download/v[\d.]+/docker-compose-linux-\w+$", path)
+        if m:
+            return self.send_blob("compose-asset", path, st.sizes["compose"], head)
+
+        self.state.count("not-found", self.command)
+        self.send_body(404, b"not found", "text/plain", {}, head)
+
+    def send_metadata(self, endpoint, text, content_type, head):
+        body = text.encode()
+        etag = '"%s"' % hashlib.sha256(body).hexdigest()[:16]
+        if self.headers.get("If-None-Match") == etag:
+            self.state.count(endpoint + " (304)", self.command)
+            return self.send_body(304, b"", content_type, {"ETag": etag}, head)
+        self.state.count(endpoint, self.command, 0 if head else len(body))
+        self.send_body(200, body, content_type, {"ETag": etag}, head)
+
+    def send_body(self, status, body, content_type, headers, head):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        if not head and body:
+            self.wfile.write(body)
+
+    def send_blob(self, endpoint, name, size, head):
+        data = self.state.blob(name, size)
+        size = len(data)
+        etag = '"%s"' % hashlib.sha256(name.encode()).hexdigest()[:16]
+        start, end, status = 0, size - 1, 200
+
+        range_header = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if range_header and (not if_range or if_range == etag):
+            m = re.match(r"bytes=(\d+)-(\d*)$", range_header)
+            if m:
+                start = int(m.group(1))
+                end = min(int(m.group(2)), size - 1) if m.group(2) else size - 1
+                if start >= size:
+                    self.state.count(endpoint + " (416)", self.command)
+                    return self.send_body(416, b"", "text/plain", {"Content-Range": f"bytes */{size}"}, head)
+                status = 206
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", etag)
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+        if head:
+            self.state.count(endpoint, "HEAD")
+            return
+
+        # 按需注入传输中断：只发送一半数据后断开连接
+        stop = end + 1
+        if self.state.should_fail():
+            stop = start + (end - start + 1) // 2
+            self.close_connection = True
+
+        sent = 0
+        chunk = 256 * 1024
+        started = time.monotonic()
+        pos = start
+        try:
+            while pos < stop:
+                piece = data[pos:min(pos + chunk, stop)]
+                self.wfile.write(piece)
+                pos += len(piece)
+                sent += len(piece)
+                if self.state.bandwidth:
+                    # 单连接带宽限制
+                    expected = sent / self.state.bandwidth
+                    elapsed = time.monotonic() - started
+                    if expected > elapsed:
+                        time.sleep(expected - elapsed)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        self.state.count(endpoint, "GET", sent)
+
+
+class InstrumentedUpdater(update.DockerUpdater):
+    """统计更新器从磁盘重复读取（重新计算哈希）的字节数"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.bytes_reread = 0
+
+    def calculate_file_hash(self, filepath, algorithm='sha256'):
+        self.bytes_reread += os.path.getsize(filepath)
+        return super().calculate_file_hash(filepath, algorithm)
+
+    def update_hash_from_file(self, hash_obj, filepath):
+        self.bytes_reread += os.path.getsize(filepath)
+        return super().update_hash_from_file(hash_obj, filepath)
+
+
+def make_updater(base_url, output_dir, options):
+    updater = InstrumentedUpdater(output_dir=output_dir, **options)
+    static_base = f"{base_url}/linux/static/stable"
+    updater.docker_url_template = static_base + "/{arch}/docker-{version}.tgz"
+    updater.rootless_url_template = static_base + "/{arch}/docker-rootless-extras-{version}.tgz"
+    updater.compose_url_template = base_url + "/compose/releases/download/v{version}/docker-compose-linux-{arch}"
+    updater.static_index_template = static_base + "/{arch}/"
+    updater.github_api = base_url
+    updater.console = open(os.devnull, "w")
+    return updater
+
+
+def run_once(state, base_url, output_dir, options):
+    state.reset()
+    updater = make_updater(base_url, output_dir, options)
+    started = time.monotonic()
+    cpu_started = time.process_time()
+    ok = updater.update()
+    wall = time.monotonic() - started
+    cpu = time.process_time() - cpu_started
+    updater.log_writer.close()
+    updater.console.close()
+    return {
+        "ok": ok,
+        "wall_seconds": round(wall, 3),
+        "cpu_seconds": round(cpu, 3),
+        "requests": dict(sorted(state.requests.items())),
+        "request_total": sum(state.requests.values()),
+        "bytes_transferred": state.bytes_sent,
+        "bytes_reread": updater.bytes_reread,
+        "injected_failures": state.failures,
+        "download_stats": dict(updater.download_stats),
+    }
+
+
+def print_report(label, result):
+    print(f"\n== {label} ==")
+    print(f"  成功: {result['ok']}")
+    print(f"  耗时: {result['wall_seconds']:.3f} s (CPU {result['cpu_seconds']:.3f} s)")
+    print(f"  传输字节: {result['bytes_transferred'] / (1024 * 1024):.2f} MB")
+    print(f"  磁盘重复读取: {result['bytes_reread'] / (1024 * 1024):.2f} MB")
+    print(f"  注入失败: {result['injected_failures']}")
+    print(f"  请求数: {result['request_total']}")
+    for key, value in result["requests"].items():
+        print(f"    {value:4d}  {key}")
+
+
+def check_regression(results, baseline, tolerance):
+    """与基线比较，耗时超出容差或请求数/传输量/重复读取量增加时视为回归"""
+    problems = []
+    for label, result in results.items():
+        base = baseline.get(label)
+        if not base:
+            continue
+        # 额外 50ms 余量，避免极短耗时的正常抖动被误报
+        if result["wall_seconds"] > base["wall_seconds"] * (1 + tolerance) + 0.05:
+            problems.append(f"{label}: 耗时 {result['wall_seconds']}s > 基线 {base['wall_seconds']}s")
+        for key in ("request_total", "bytes_transferred", "bytes_reread"):
+            if result[key] > base[key]:
+                problems.append(f"{label}: {key} {result[key]} > 基线 {base[key]}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='update.py 离线性能基准测试')
+    parser.add_argument('--docker-size', type=float, default=70, help='Docker 静态包大小，单位 MB (默认: 70)')
+    parser.add_argument('--rootless-size', type=float, default=20, help='Rootless Extras 大小，单位 MB (默认: 20)')
+    parser.add_argument('--compose-size', type=float, default=35, help='Compose 二进制大小，单位 MB (默认: 35)')
+    parser.add_argument('--latency', type=float, default=0, help='每个请求注入的延迟，单位毫秒 (默认: 0)')
+    parser.add_argument('--bandwidth', type=float, default=0, help='单连接带宽上限，单位 MB/s (默认: 不限)')
+    parser.add_argument('--fail-rate', type=float, default=0, help='文件传输中途断开的概率 (默认: 0)')
+    parser.add_argument('--seed', type=int, default=1, help='失败注入随机种子 (默认: 1)')
+    parser.add_argument('--runs', type=int, default=2,
+                        help='在同一输出目录连续运行次数，第 2 次起衡量无变化时的开销 (默认: 2)')
+    parser.add_argument('--updater-args', default='{}',
+                        help='传给 DockerUpdater 的 JSON 参数，例如 \'{"jobs": 6, "sync": true}\'')
+    parser.add_argument('--save', metavar='FILE', help='将结果保存为 JSON (可作为基线)')
+    parser.add_argument('--baseline', metavar='FILE', help='与基线 JSON 比较，出现回归时以非零状态退出')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='耗时回归容差 (默认: 0.25)')
+    args = parser.parse_args()
+
+    mb = 1024 * 1024
+    state = UpstreamState(
+        docker_version="29.1.5",
+        compose_version="5.0.1",
+        sizes={
+            "docker": int(args.docker_size * mb),
+            "rootless": int(args.rootless_size * mb),
+            "compose": int(args.compose_size * mb),
+        },
+        latency=args.latency / 1000,
+        bandwidth=args.bandwidth * mb,
+        fail_rate=args.fail_rate,
+        seed=args.seed,
+    )
+    # 预先生成 tar.gz 内容，避免首次请求时的生成耗时计入结果
+    for arch in ("x86_64", "aarch64"):
+        for prefix in ("docker", "docker-rootless-extras"):
+            kind = "rootless" if "rootless" in prefix else "docker"
+            state.blob(f"/linux/static/stable/{arch}/{prefix}-{state.docker_version}.tgz", state.sizes[kind])
+    UpstreamHandler.state = state
+    server = ThreadingHTTPServer(("127.0.0.1", 0), UpstreamHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    options = json.loads(args.updater_args)
+    output_dir = tempfile.mkdtemp(prefix="docker-offline-bench-")
+    results = {}
+    try:
+        for run in range(args.runs):
+            label = "cold" if run == 0 else f"warm-{run}"
+            results[label] = run_once(state, base_url, output_dir, options)
+            print_report(label, results[label])
+    finally:
+        server.shutdown()
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            problems = check_regression(results, json.load(f), args.tolerance)
+        if problems:
+            print("\n性能回归:")
+            for problem in problems:
+                print(f"  ✗ {problem}")
+            sys.exit(1)
+        print("\n✓ 未发现性能回归")
+
+    sys.exit(0 if all(result["ok"] for result in results.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -121,6 +121,13 @@ extract_version() {
     fi
 }
 
+# CHANNEL 指定时只考虑 channels/<CHANNEL>.SHA256SUMS 中列出的文件（update.py --channels 生成）
+in_channel() {
+    [[ -z "$CHANNEL" ]] && return 0
+    awk -v name="$(basename "$1")" '$2 == name { found = 1 } END { exit !found }' \
+        "$(dirname "$1")/channels/${CHANNEL}.SHA256SUMS"
+}
+
 find_latest_file() {
     local pattern="$1"
     local latest_file=""
@@ -128,6 +135,7 @@ find_latest_file() {
     
     for file in $pattern; do
         [[ ! -f "$file" ]] && continue
+        in_channel "$file" || continue
         
         local version=$(extract_version "$(basename "$file")")
         if [[ $(printf '%s\n' "$version" "$latest_version" | sort -V | tail -n1) == "$version" ]]; then
@@ -146,6 +154,7 @@ find_latest_docker_file() {
     
     for file in $pattern; do
         [[ ! -f "$file" ]] && continue
+        in_channel "$file" || continue
         
         local filename=$(basename "$file")
         
@@ -162,6 +171,52 @@ find_latest_docker_file() {
     echo "$latest_file"
 }
 
+# ============================================================================
+# Remote Packages (update.py serve)
+# ============================================================================
+
+# 从 update.py serve 发布的分发主机拉取本架构的安装包，断点续传并按 SHA256SUMS 校验
+fetch_packages() {
+    local url="${1%/}"
+    local base_dir="$2"
+    local arch="$3"
+    
+    command -v curl &>/dev/null || error_exit "curl is required to fetch packages from ${url}"
+    mkdir -p "$base_dir"
+    
+    print_info "🌐 Fetching package index from ${COLOR_KEY}${url}${COLOR_RESET}..."
+    local sums_path="SHA256SUMS"
+    [[ -n "$CHANNEL" ]] && sums_path="channels/${CHANNEL}.SHA256SUMS"
+    local sums
+    sums=$(curl -fsS --retry 3 "${url}/${sums_path}") || error_exit "Failed to fetch ${url}/${sums_path}"
+    if [[ -n "$CHANNEL" ]]; then
+        mkdir -p "$base_dir/channels"
+        printf '%s\n' "$sums" > "$base_dir/${sums_path}"
+    fi
+    
+    local checksum name fetched=0
+    while read -r checksum name; do
+        [[ "$name" == *"-${arch}.tgz" || "$name" == docker-compose-linux-*"-${arch}" ]] || continue
+        
+        if [[ -f "$base_dir/$name" ]] && echo "${checksum}  ${base_dir}/${name}" | sha256sum -c --status; then
+            print_debug "Up to date: ${name}"
+            continue
+        fi
+        
+        print_highlight "info" "⬇️  Downloading ${COLOR_KEY}${name}${COLOR_RESET}..." "$COLOR_INFO"
+        curl -fsS --retry 3 -C - -o "$base_dir/$name.part" "${url}/${name}" || error_exit "Failed to download ${name}"
+        if ! echo "${checksum}  ${base_dir}/${name}.part" | sha256sum -c --status; then
+            rm -f "$base_dir/$name.part"
+            error_exit "Checksum mismatch for ${name}"
+        fi
+        mv -f "$base_dir/$name.part" "$base_dir/$name"
+        [[ "$name" == *.tgz ]] && curl -fsS -o "$base_dir/$name.manifest.json" "${url}/${name}.manifest.json" 2>/dev/null || true
+        fetched=$((fetched + 1))
+    done <<< "$sums"
+    
+    print_success "✓ Packages verified (${fetched} downloaded)"
+}
+
 # ============================================================================
 # Podman Cleanup (Optional)
 # ============================================================================
@@ -196,6 +251,13 @@ cleanup_podman() {
 # Docker Installation
 # ============================================================================
 
+# 读取 update.py 生成的归档成员清单中的 strip_components，没有清单时输出为空
+archive_strip_components() {
+    local manifest="$1.manifest.json"
+    [[ -f "$manifest" ]] || return 0
+    sed -n 's/^ *"strip_components": *\([0-9][0-9]*\).*/\1/p' "$manifest" | head -n1
+}
+
 install_docker_binaries() {
     local base_dir="$1"
     local arch="$2"
@@ -248,17 +310,27 @@ install_rootless_extras() {
     local filename=$(basename "$rootless_file")
     print_highlight "info" "📦 Installing rootless extras from ${COLOR_KEY}${filename}${COLOR_RESET}..." "$COLOR_INFO"
     
-    tar xzf "$rootless_file" -C /tmp || error_exit "Failed to extract rootless extras"
+    local strip_components=$(archive_strip_components "$rootless_file")
     
-    if [[ -d "/tmp/docker" ]]; then
-        cp -f /tmp/docker/* /usr/bin/
+    if [[ -n "$strip_components" ]]; then
+        # 清单已给出归档布局，只需解压一次
+        local extract_dir=$(mktemp -d)
+        tar xzf "$rootless_file" -C "$extract_dir" --strip-components="$strip_components" || error_exit "Failed to extract rootless extras"
+        find "$extract_dir" -maxdepth 1 -type f -exec cp -f {} /usr/bin/ \;
+        rm -rf "$extract_dir"
     else
-        tar xzf "$rootless_file" -C /tmp --strip-components=1 || error_exit "Failed to extract rootless extras"
-        cp -f /tmp/rootlesskit* /tmp/vpnkit /usr/bin/ 2>/dev/null || true
+        tar xzf "$rootless_file" -C /tmp || error_exit "Failed to extract rootless extras"
+        
+        if [[ -d "/tmp/docker" ]]; then
+            cp -f /tmp/docker/* /usr/bin/
+        else
+            tar xzf "$rootless_file" -C /tmp --strip-components=1 || error_exit "Failed to extract rootless extras"
+            cp -f /tmp/rootlesskit* /tmp/vpnkit /usr/bin/ 2>/dev/null || true
+        fi
+        
+        rm -rf /tmp/docker /tmp/rootlesskit* /tmp/vpnkit
     fi
     
-    rm -rf /tmp/docker /tmp/rootlesskit* /tmp/vpnkit
-    
     print_success "✓ Rootless extras installed"
 }
 
@@ -363,6 +435,18 @@ main() {
     print_highlight "info" "Base directory: ${COLOR_VALUE}${BASE_DIR}${COLOR_RESET}" "$COLOR_INFO"
     print_highlight "info" "Architecture: ${COLOR_VALUE}${ARCH}${COLOR_RESET}" "$COLOR_INFO"
     
+    # PACKAGES_URL=http://staging-host:8080 时先从分发主机拉取安装包
+    if [[ -n "$PACKAGES_URL" ]]; then
+        echo ""
+        fetch_packages "$PACKAGES_URL" "$BASE_DIR" "$ARCH"
+    fi
+    
+    # CHANNEL=28 时只安装该通道的版本
+    if [[ -n "$CHANNEL" ]]; then
+        [[ -f "$BASE_DIR/channels/${CHANNEL}.SHA256SUMS" ]] || error_exit "Channel manifest not found: ${BASE_DIR}/channels/${CHANNEL}.SHA256SUMS"
+        print_highlight "info" "Channel: ${COLOR_VALUE}${CHANNEL}${COLOR_RESET}" "$COLOR_INFO"
+    fi
+    
     # Find services directory
     local SERVICES_DIR=$(detect_services_dir "$BASE_DIR")
     [[ -z "$SERVICES_DIR" ]] && error_exit "Services directory not found"
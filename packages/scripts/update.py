@@ -6,16 +6,43 @@ Docker 离线安装包自动更新脚本 (GitHub Actions 优化版)
 """
 
 import os
+import re
 import sys
 import json
+import time
+import random
+import atexit
+import base64
+import queue
+import io
+import socket
+import contextlib
+import http.client
+import http.server
+import urllib.parse
 import urllib.request
 import urllib.error
 import hashlib
+import struct
+import tarfile
+import gzip
+import lzma
+import zlib
+import heapq
 import shutil
 import argparse
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
 from pathlib import Path
 
+try:
+    import fcntl
+except ImportError:  # 非 POSIX 平台退回到独占创建锁文件
+    fcntl = None
+
 # ANSI 颜色代码 - VS Code 风格
 class Colors:
     RESET = "\033[0m"
@@ -31,13 +58,1069 @@ class Colors:
     DIMMED = "\033[0;37m"         # 淡白色 - 详细信息
     BOLD = "\033[1m"              # 加粗
 
+# 预编译的 ANSI 颜色代码匹配，用于写入日志文件前去除颜色
+ANSI_ESCAPE_RE = re.compile(r"\033\[[0-9;]*m")
+
+
+class LogWriter:
+    """后台线程批量写入日志文件，调用方只需入队，不会被磁盘 I/O 阻塞；path 为 None 时丢弃日志"""
+    
+    def __init__(self, path, batch_size=256):
+        self.path = path
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+    
+    def write(self, line):
+        if self.path is None:
+            return
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                    self._thread.start()
+        self._queue.put(line)
+    
+    def _run(self):
+        # 整个运行期间只打开一次日志文件，每批日志只 flush 一次
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                batch = [self._queue.get()]
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                stop = None in batch
+                f.writelines(line for line in batch if line is not None)
+                f.flush()
+                if stop:
+                    return
+    
+    def close(self):
+        """写完队列中剩余的日志并停止后台线程"""
+        with self._start_lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+
+class FileLock:
+    """进程间排他锁，多个分片进程或 merge 共享同一输出目录时使用"""
+    
+    def __init__(self, path, poll_interval=0.1):
+        self.path = Path(path)
+        self.poll_interval = poll_interval
+        self._fd = None
+    
+    def __enter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if fcntl is not None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            return self
+        while True:
+            try:
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o644)
+                return self
+            except FileExistsError:
+                time.sleep(self.poll_interval)
+    
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+        else:
+            os.close(self._fd)
+            os.unlink(self.path)
+        self._fd = None
+        return False
+
+
+class ArchiveError(IOError):
+    """下载的 tar.gz 归档损坏或不完整"""
+
+
+class TarStreamValidator:
+    """在后台线程中以流模式解析 tar.gz 数据，下载结束时即完成校验并得到成员清单
+    
+    接口与 hashlib 对象一致（update），可以和 SHA256 共用同一个数据循环。
+    """
+    
+    def __init__(self, max_pending=16):
+        self._queue = queue.Queue(max_pending)
+        self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._pending = b""
+        self._eof = False
+        self._error = None
+        self._members = []
+        self._thread = threading.Thread(target=self._run, name="tar-validator", daemon=True)
+        self._thread.start()
+    
+    def update(self, data):
+        # 调用方会复用缓冲区，这里必须复制一份
+        self._queue.put(bytes(data))
+    
+    def read(self, size=-1):
+        """供 tarfile 读取解压后的数据"""
+        while not self._pending:
+            if self._eof:
+                return b""
+            chunk = self._queue.get()
+            if chunk is None:
+                self._eof = True
+                if not self._decompressor.eof:
+                    raise ArchiveError("gzip 数据不完整")
+                return b""
+            if self._decompressor.eof:
+                continue
+            self._pending = self._decompressor.decompress(chunk)
+        if size is None or size < 0:
+            size = len(self._pending)
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+    
+    def _run(self):
+        try:
+            with tarfile.open(fileobj=self, mode="r|") as tar:
+                for member in tar:
+                    if member.isdir():
+                        kind = "dir"
+                    elif member.issym():
+                        kind = "symlink"
+                    elif member.islnk():
+                        kind = "hardlink"
+                    elif member.isfile():
+                        kind = "file"
+                    else:
+                        kind = "other"
+                    self._members.append({
+                        "path": member.name,
+                        "type": kind,
+                        "size": member.size,
+                        "mode": f"{member.mode:04o}",
+                    })
+            # 读完归档结束标记之后的填充数据，以校验 gzip 尾部的 CRC 与长度
+            while self.read(1024 * 1024):
+                pass
+        except Exception as e:
+            self._error = e
+        finally:
+            # 出错后继续消费队列，避免下载线程阻塞
+            while not self._eof:
+                if self._queue.get() is None:
+                    self._eof = True
+    
+    @staticmethod
+    def relative_path(path):
+        """去掉成员路径开头的 ./ 前缀与 /，保留以点开头的名称（如 .hidden）"""
+        while path.startswith("./"):
+            path = path[2:]
+        return path.lstrip("/")
+    
+    def finish(self):
+        """结束输入并等待解析完成，返回成员清单；归档无效时抛出 ArchiveError"""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        if self._error is not None:
+            raise ArchiveError(f"归档校验失败: {self._error}")
+        
+        # 所有成员位于同一个顶层目录时，安装脚本可以用 --strip-components 直接解压
+        paths = [(self.relative_path(member["path"]), member["type"]) for member in self._members]
+        tops = {path.split("/", 1)[0] for path, _ in paths if path not in ("", ".")}
+        prefix = tops.pop() if len(tops) == 1 else ""
+        if prefix and any(path == prefix and kind != "dir" for path, kind in paths):
+            prefix = ""
+        return {
+            "prefix": prefix,
+            "strip_components": 1 if prefix else 0,
+            "members": self._members,
+        }
+    
+    def close(self):
+        try:
+            self.finish()
+        except ArchiveError:
+            pass
+
+
+class DeltaError(ValueError):
+    """差量补丁格式无效，或重建结果与记录的摘要不一致"""
+
+
+class BinaryDelta:
+    """两个版本文件之间的二进制差量补丁
+    
+    按内容定义的锚点把新旧数据切分成块，新文件中与旧文件相同的块记为复制指令，
+    其余数据作为字面量写入，整个指令流再用 xz 压缩。tar.gz 文件先解压后在 tar 层面
+    比较，应用补丁时用记录的压缩参数（zlib 或系统 gzip 命令）重新压缩，从而逐字节
+    还原原始文件。
+    """
+    
+    MAGIC = b"DOCKER-OFFLINE-DELTA\n"
+    # 两字节锚点，均匀数据中平均每 4 KiB 出现一次
+    ANCHOR_RE = re.compile(rb"[\x11\x5a\xa3\xe7][\x2c\x6d\xb1\xf4]")
+    # 依次尝试的压缩参数，gzip 与 tarfile 的默认级别排在最前；
+    # 上游 tar.gz 由 GNU gzip 生成，可压缩数据只有 gzip 命令本身能逐字节重现
+    GZIP_LEVELS = (6, 9, 1, 2, 3, 4, 5, 7, 8)
+    PROBE_SIZE = 4 * 1024 * 1024
+    
+    def __init__(self, min_chunk=512, max_chunk=16 * 1024):
+        self.min_chunk = min_chunk
+        self.max_chunk = max_chunk
+    
+    def chunks(self, data):
+        """返回 (起始, 结束) 分块，边界由内容决定，插入或删除数据后能重新对齐"""
+        start = 0
+        for match in self.ANCHOR_RE.finditer(data):
+            end = match.end()
+            if end - start < self.min_chunk:
+                continue
+            while end - start > self.max_chunk:
+                yield start, start + self.max_chunk
+                start += self.max_chunk
+            yield start, end
+            start = end
+        while len(data) - start > self.max_chunk:
+            yield start, start + self.max_chunk
+            start += self.max_chunk
+        if start < len(data):
+            yield start, len(data)
+    
+    @staticmethod
+    def chunk_key(data):
+        return hashlib.blake2b(data, digest_size=16).digest()
+    
+    @staticmethod
+    def common_prefix(a, b):
+        n = min(len(a), len(b))
+        matched, step = 0, 4096
+        while step:
+            while matched + step <= n and a[matched:matched + step] == b[matched:matched + step]:
+                matched += step
+            step //= 2
+        return matched
+    
+    @staticmethod
+    def common_suffix(a, b):
+        n = min(len(a), len(b))
+        matched, step = 0, 4096
+        while step:
+            while (matched + step <= n and
+                   a[len(a) - matched - step:len(a) - matched] == b[len(b) - matched - step:len(b) - matched]):
+                matched += step
+            step //= 2
+        return matched
+    
+    def diff(self, source, target):
+        """生成指令列表：("C", 源偏移, 长度) 复制旧数据，("I", 起始, 结束) 写入新数据的该区间"""
+        source, target = memoryview(source), memoryview(target)
+        index = {}
+        for start, end in self.chunks(source):
+            index.setdefault(self.chunk_key(source[start:end]), start)
+        
+        ops = []
+        
+        def emit_copy(offset, length):
+            if ops and ops[-1][0] == "C" and ops[-1][1] + ops[-1][2] == offset:
+                ops[-1] = ("C", ops[-1][1], ops[-1][2] + length)
+            else:
+                ops.append(("C", offset, length))
+        
+        for start, end in self.chunks(target):
+            offset = index.get(self.chunk_key(target[start:end]))
+            if offset is not None and source[offset:offset + end - start] == target[start:end]:
+                # 向前扩展匹配：吸收上一段字面量末尾与旧数据相同的部分
+                if ops and ops[-1][0] == "I":
+                    _, lit_start, lit_end = ops[-1]
+                    n = self.common_suffix(target[lit_start:lit_end], source[max(0, offset - (lit_end - lit_start)):offset])
+                    if n:
+                        if n == lit_end - lit_start:
+                            ops.pop()
+                        else:
+                            ops[-1] = ("I", lit_start, lit_end - n)
+                        emit_copy(offset - n, n)
+                emit_copy(offset, end - start)
+                continue
+            
+            # 向后扩展上一段复制，只把真正不同的数据作为字面量
+            if ops and ops[-1][0] == "C":
+                copy_end = ops[-1][1] + ops[-1][2]
+                n = self.common_prefix(target[start:end], source[copy_end:copy_end + end - start])
+                if n:
+                    emit_copy(copy_end, n)
+                    start += n
+            if start < end:
+                if ops and ops[-1][0] == "I" and ops[-1][2] == start:
+                    ops[-1] = ("I", ops[-1][1], end)
+                else:
+                    ops.append(("I", start, end))
+        return ops
+    
+    def encode_ops(self, ops, target):
+        payload = bytearray()
+        for op in ops:
+            if op[0] == "C":
+                payload += b"C" + struct.pack("<QQ", op[1], op[2])
+            else:
+                payload += b"I" + struct.pack("<Q", op[2] - op[1]) + target[op[1]:op[2]]
+        return bytes(payload)
+    
+    @staticmethod
+    def iter_patch(source, payload):
+        """解析指令流，依次产出重建后的数据片段"""
+        source = memoryview(source)
+        pos = 0
+        while pos < len(payload):
+            op = payload[pos:pos + 1]
+            if op == b"C":
+                offset, length = struct.unpack_from("<QQ", payload, pos + 1)
+                if offset + length > len(source):
+                    raise DeltaError("复制指令超出源文件范围")
+                yield source[offset:offset + length]
+                pos += 17
+            elif op == b"I":
+                (length,) = struct.unpack_from("<Q", payload, pos + 1)
+                pos += 9
+                if pos + length > len(payload):
+                    raise DeltaError("字面量数据不完整")
+                yield payload[pos:pos + length]
+                pos += length
+            else:
+                raise DeltaError(f"未知指令: {op!r}")
+    
+    @staticmethod
+    def split_gzip(data):
+        """拆分单成员 gzip 文件，返回 (头部, deflate 数据, 尾部, 解压数据)；无法拆分时返回 None"""
+        if data[:3] != b"\x1f\x8b\x08":
+            return None
+        flags, pos = data[3], 10
+        try:
+            if flags & 0x04:
+                pos += 2 + int.from_bytes(data[pos:pos + 2], "little")
+            if flags & 0x08:
+                pos = data.index(b"\x00", pos) + 1
+            if flags & 0x10:
+                pos = data.index(b"\x00", pos) + 1
+            if flags & 0x02:
+                pos += 2
+            decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            inner = decompressor.decompress(memoryview(data)[pos:])
+        except (ValueError, zlib.error):
+            return None
+        if not decompressor.eof or len(decompressor.unused_data) != 8:
+            return None
+        return data[:pos], memoryview(data)[pos:len(data) - 8], data[len(data) - 8:], inner
+    
+    @staticmethod
+    def deflate(inner, params):
+        """按记录的参数重新压缩，返回 deflate 数据（不含 gzip 头部与尾部）"""
+        if params["program"] == "gzip":
+            result = subprocess.run(["gzip", "-c", "-n", f"-{params['level']}"], input=inner,
+                                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+            parts = BinaryDelta.split_gzip(result.stdout)
+            if parts is None:
+                raise DeltaError("gzip 命令输出无效")
+            return parts[1]
+        compressor = zlib.compressobj(params["level"], zlib.DEFLATED, -zlib.MAX_WBITS, params["mem_level"])
+        return compressor.compress(inner) + compressor.flush()
+    
+    def find_gzip_parameters(self, deflated, inner):
+        """寻找能逐字节重现原始 deflate 数据的压缩参数，找不到时返回 None"""
+        for level in self.GZIP_LEVELS:
+            for mem_level in (8, 9):
+                # 先只压缩开头一段，大部分不匹配的参数无需压缩整个文件
+                compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, mem_level)
+                probe = compressor.compress(inner[:self.PROBE_SIZE])
+                if deflated[:len(probe)] != probe:
+                    continue
+                rest = compressor.compress(inner[self.PROBE_SIZE:]) + compressor.flush()
+                if len(probe) + len(rest) == len(deflated) and deflated[len(probe):] == rest:
+                    return {"program": "zlib", "level": level, "mem_level": mem_level}
+        if shutil.which("gzip"):
+            for level in self.GZIP_LEVELS:
+                params = {"program": "gzip", "level": level}
+                try:
+                    if self.deflate(inner, params) == deflated:
+                        return params
+                except (OSError, subprocess.CalledProcessError, DeltaError):
+                    break
+        return None
+    
+    def create(self, source_path, target_path):
+        """生成补丁文件内容；tar.gz 无法逐字节重新压缩时退回到直接比较原始字节"""
+        source = Path(source_path).read_bytes()
+        target = Path(target_path).read_bytes()
+        header = {
+            "format": 1,
+            "source": {"name": Path(source_path).name, "size": len(source), "sha256": hashlib.sha256(source).hexdigest()},
+            "target": {"name": Path(target_path).name, "size": len(target), "sha256": hashlib.sha256(target).hexdigest(),
+                       "mode": f"{Path(target_path).stat().st_mode & 0o777:04o}"},
+            "encoding": "raw",
+        }
+        
+        parts = self.split_gzip(target)
+        if parts is not None:
+            try:
+                source_inner = gzip.decompress(source)
+            except (OSError, EOFError, zlib.error):
+                source_inner = None
+            parameters = self.find_gzip_parameters(parts[1], parts[3]) if source_inner is not None else None
+            if parameters is not None:
+                header["encoding"] = "gzip"
+                header["gzip"] = dict(parameters, header=parts[0].hex(), trailer=parts[2].hex(),
+                                      zlib_version=zlib.ZLIB_VERSION)
+                source, target = source_inner, parts[3]
+        
+        payload = self.encode_ops(self.diff(source, target), memoryview(target))
+        header_bytes = json.dumps(header, sort_keys=True).encode("utf-8")
+        return self.MAGIC + struct.pack("<I", len(header_bytes)) + header_bytes + lzma.compress(payload)
+    
+    @classmethod
+    def read_header(cls, path):
+        with open(path, "rb") as f:
+            if f.read(len(cls.MAGIC)) != cls.MAGIC:
+                raise DeltaError(f"不是差量补丁文件: {path}")
+            (length,) = struct.unpack("<I", f.read(4))
+            try:
+                return json.loads(f.read(length).decode("utf-8"))
+            except ValueError as e:
+                raise DeltaError(f"补丁头部无效: {e}")
+    
+    @classmethod
+    def apply(cls, delta_path, source_path, output):
+        """将补丁应用到源文件，重建数据写入 output，返回重建文件的 SHA256"""
+        with open(delta_path, "rb") as f:
+            data = f.read()
+        header = cls.read_header(delta_path)
+        offset = len(cls.MAGIC) + 4 + struct.unpack_from("<I", data, len(cls.MAGIC))[0]
+        try:
+            payload = lzma.decompress(memoryview(data)[offset:])
+        except lzma.LZMAError as e:
+            raise DeltaError(f"补丁数据损坏: {e}")
+        
+        source = Path(source_path).read_bytes()
+        if hashlib.sha256(source).hexdigest() != header["source"]["sha256"]:
+            raise DeltaError(f"源文件与补丁记录的摘要不一致: {Path(source_path).name}")
+        
+        digest = hashlib.sha256()
+        
+        def write(chunk):
+            digest.update(chunk)
+            output.write(chunk)
+        
+        if header["encoding"] == "gzip":
+            params = header["gzip"]
+            inner = b"".join(cls.iter_patch(gzip.decompress(source), payload))
+            try:
+                deflated = cls.deflate(inner, params)
+            except (OSError, subprocess.CalledProcessError) as e:
+                raise DeltaError(f"无法重新压缩 ({params['program']}): {e}")
+            write(bytes.fromhex(params["header"]))
+            write(deflated)
+            write(bytes.fromhex(params["trailer"]))
+        else:
+            for piece in cls.iter_patch(source, payload):
+                write(piece)
+        return digest.hexdigest()
+
+
+class UpstreamError(IOError):
+    """上游服务不可用、拒绝请求或要求的等待时间过长，继续重试无法解决"""
+
+
+class CircuitOpenError(UpstreamError):
+    """主机的熔断器处于打开状态，请求未发出即被拒绝"""
+
+
+class RetryPolicy:
+    """所有上游请求共享的重试策略
+    
+    指数退避加随机抖动（equal jitter），避免多个线程或实例同时重试；服务端通过
+    Retry-After 或 X-RateLimit-Reset 指定了等待时间时按其等待，超过 max_wait 时直接失败。
+    """
+    
+    RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+    
+    def __init__(self, attempts=3, base_delay=1.0, max_delay=30.0, max_wait=300.0):
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_wait = max_wait
+    
+    def server_wait(self, error):
+        """返回服务端要求的等待秒数，没有要求时返回 None"""
+        headers = getattr(error, "headers", None)
+        if headers is None:
+            return None
+        retry_after = (headers.get("Retry-After") or "").strip()
+        if retry_after.isdigit():
+            return float(retry_after)
+        if retry_after:
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError, IndexError):
+                pass
+        reset = (headers.get("X-RateLimit-Reset") or "").strip()
+        if headers.get("X-RateLimit-Remaining") == "0" and reset.isdigit():
+            return max(0.0, int(reset) - time.time()) + 1
+        return None
+    
+    def is_retryable(self, error):
+        if isinstance(error, UpstreamError):
+            return False
+        if isinstance(error, urllib.error.HTTPError):
+            # 403 只有在速率限制（带等待时间）时才值得重试
+            return error.code in self.RETRYABLE_STATUS or (error.code == 403 and self.server_wait(error) is not None)
+        return isinstance(error, (OSError, http.client.HTTPException))
+    
+    def delay(self, attempt, error=None):
+        """第 attempt 次（从 0 开始）失败后的等待秒数；服务端要求的等待超过 max_wait 时抛出 UpstreamError"""
+        wait = self.server_wait(error) if error is not None else None
+        if wait is not None:
+            if wait > self.max_wait:
+                raise UpstreamError(f"服务端要求等待 {wait:.0f} 秒，超过上限 {self.max_wait:.0f} 秒")
+            return wait + random.uniform(0, self.base_delay)
+        ceiling = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+
+class CircuitBreaker:
+    """按主机统计连续的连接失败与 5xx 响应，达到阈值后在冷却期内直接拒绝请求
+    
+    冷却期结束后只放行一个探测请求（半开状态），成功则恢复，失败则重新进入冷却期。
+    """
+    
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._hosts = {}
+        self._lock = threading.Lock()
+    
+    def before_request(self, host):
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None or state["opened_at"] is None:
+                return
+            remaining = state["opened_at"] + self.reset_timeout - time.monotonic()
+            if remaining > 0 or state["probing"]:
+                raise CircuitOpenError(f"{host} 连续失败 {state['failures']} 次，已熔断 (约 {max(0.0, remaining):.0f} 秒后重试)")
+            state["probing"] = True
+    
+    def record(self, host, ok):
+        with self._lock:
+            if ok:
+                self._hosts.pop(host, None)
+                return
+            state = self._hosts.setdefault(host, {"failures": 0, "opened_at": None, "probing": False})
+            state["failures"] += 1
+            state["probing"] = False
+            if state["failures"] >= self.failure_threshold:
+                state["opened_at"] = time.monotonic()
+    
+    def snapshot(self):
+        with self._lock:
+            return {host: state["failures"] for host, state in self._hosts.items() if state["opened_at"] is not None}
+
+
+class TransferScheduler:
+    """限制每个主机的并发连接数并按优先级分配空闲槽位，可选全局令牌桶限速"""
+    
+    PRIORITY_METADATA = 0
+    PRIORITY_SMALL = 1
+    PRIORITY_BULK = 2
+    
+    def __init__(self, max_per_host=6, rate_limit=None):
+        self.max_per_host = max(1, max_per_host)
+        self.rate_limit = rate_limit
+        self._cond = threading.Condition()
+        self._active = {}
+        self._waiting = {}
+        self._seq = 0
+        # 令牌桶：最多积累 1 秒的流量，允许短时突发
+        self._bucket_lock = threading.Lock()
+        self._tokens = rate_limit or 0
+        self._stamp = time.monotonic()
+    
+    def acquire(self, host, priority):
+        """等待主机空闲槽位；同一主机的等待者按 (优先级, 到达顺序) 依次获得槽位"""
+        with self._cond:
+            self._seq += 1
+            ticket = (priority, self._seq)
+            waiting = self._waiting.setdefault(host, [])
+            heapq.heappush(waiting, ticket)
+            while self._active.get(host, 0) >= self.max_per_host or waiting[0] != ticket:
+                self._cond.wait()
+            heapq.heappop(waiting)
+            self._active[host] = self._active.get(host, 0) + 1
+            self._cond.notify_all()
+    
+    def release(self, host):
+        with self._cond:
+            self._active[host] -= 1
+            self._cond.notify_all()
+    
+    def consume(self, nbytes):
+        """扣除已接收字节对应的令牌，令牌不足时休眠到欠额补齐"""
+        if not self.rate_limit or nbytes <= 0:
+            return
+        with self._bucket_lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate_limit, self._tokens + (now - self._stamp) * self.rate_limit)
+            self._stamp = now
+            self._tokens -= nbytes
+            wait = -self._tokens / self.rate_limit if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+class PooledResponse:
+    """包装 http.client 响应，关闭时将可复用的连接归还连接池并释放调度槽位"""
+    
+    def __init__(self, session, key, conn, response, url):
+        self._session = session
+        self._key = key
+        self._conn = conn
+        self._response = response
+        self.url = url
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+    
+    def getcode(self):
+        return self.status
+    
+    def read(self, amt=None):
+        data = self._response.read(amt)
+        if self._session.scheduler:
+            self._session.scheduler.consume(len(data))
+        return data
+    
+    def readinto(self, buffer):
+        n = self._response.readinto(buffer)
+        if self._session.scheduler:
+            self._session.scheduler.consume(n)
+        return n
+    
+    def close(self):
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        if self._session.scheduler:
+            self._session.scheduler.release(self._key[1])
+        # 剩余响应体很小（如 HEAD 请求）时读完它，以便连接可以复用
+        remaining = self._response.length
+        if not self._response.isclosed() and remaining is not None and remaining <= 64 * 1024:
+            try:
+                self._response.read()
+            except Exception:
+                pass
+        # 只有响应体已完整读取且服务端未要求关闭时才能复用连接
+        if self._response.isclosed() and not self._response.will_close:
+            self._session._release(self._key, conn)
+        else:
+            self._response.close()
+            conn.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class HTTPSession:
+    """按主机维护 keep-alive 连接池的 HTTP 会话，避免每个请求重复 TCP/TLS 握手"""
+    
+    REDIRECT_CODES = (301, 302, 303, 307, 308)
+    
+    def __init__(self, user_agent="Mozilla/5.0", max_idle_per_host=8, max_redirects=5, scheduler=None, breaker=None):
+        self.user_agent = user_agent
+        self.max_idle_per_host = max_idle_per_host
+        self.max_redirects = max_redirects
+        self.scheduler = scheduler
+        # 按主机熔断：上游明显不可用时快速失败，而不是让每个请求各自超时重试
+        self.breaker = breaker
+        self._pools = {}
+        self._pool_lock = threading.Lock()
+        self._proxies = urllib.request.getproxies()
+    
+    def _pool_key(self, parts):
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        return (parts.scheme, parts.hostname, port)
+    
+    def _proxy_for(self, scheme, host):
+        proxy = self._proxies.get(scheme)
+        if not proxy or urllib.request.proxy_bypass(host):
+            return None
+        return urllib.parse.urlsplit(proxy if "://" in proxy else f"http://{proxy}")
+    
+    def _proxy_headers(self, proxy):
+        """代理 URL 中带有用户名时生成 Basic 认证头"""
+        if not proxy.username:
+            return {}
+        credentials = f"{urllib.parse.unquote(proxy.username)}:{urllib.parse.unquote(proxy.password or '')}"
+        return {"Proxy-Authorization": "Basic " + base64.b64encode(credentials.encode("utf-8")).decode("ascii")}
+    
+    def _new_connection(self, key, timeout):
+        scheme, host, port = key
+        proxy = self._proxy_for(scheme, host)
+        proxy_headers = {}
+        if proxy:
+            proxy_headers = self._proxy_headers(proxy)
+            proxy_port = proxy.port or (443 if proxy.scheme == "https" else 80)
+        if scheme == "https":
+            if proxy:
+                conn = http.client.HTTPSConnection(proxy.hostname, proxy_port, timeout=timeout)
+                conn.set_tunnel(host, port, headers=proxy_headers)
+            else:
+                conn = http.client.HTTPSConnection(host, port, timeout=timeout)
+        else:
+            if proxy:
+                connection_class = http.client.HTTPSConnection if proxy.scheme == "https" else http.client.HTTPConnection
+                conn = connection_class(proxy.hostname, proxy_port, timeout=timeout)
+            else:
+                conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        conn._via_proxy = bool(proxy) and scheme == "http"
+        # 直接经代理转发的明文请求需在每个请求中携带认证头，CONNECT 隧道已在 set_tunnel 中携带
+        conn._proxy_headers = proxy_headers if conn._via_proxy else {}
+        conn._timings = {}
+        conn._create_connection = self._timed_create_connection(conn._timings)
+        return conn
+    
+    def _timed_create_connection(self, timings):
+        """替换连接的 socket 创建函数，分别记录 DNS 解析与 TCP 建连耗时"""
+        def create_connection(address, timeout, source_address=None):
+            host, port = address
+            started = time.monotonic()
+            infos = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+            resolved = time.monotonic()
+            error = OSError(f"无法解析地址: {host}")
+            for *_, sockaddr in infos:
+                try:
+                    sock = socket.create_connection(sockaddr[:2], timeout, source_address)
+                    break
+                except OSError as e:
+                    error = e
+            else:
+                raise error
+            timings["dns_seconds"] = resolved - started
+            timings["connect_seconds"] = time.monotonic() - resolved
+            return sock
+        
+        return create_connection
+    
+    def _acquire(self, key, timeout):
+        with self._pool_lock:
+            idle = self._pools.get(key)
+            conn = idle.pop() if idle else None
+        if conn is None:
+            return self._new_connection(key, timeout), False
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, True
+    
+    def _release(self, key, conn):
+        with self._pool_lock:
+            idle = self._pools.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+    
+    def _send(self, method, url, headers, timeout, priority):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError(f"不支持的 URL 协议: {url}")
+        key = self._pool_key(parts)
+        path = parts.path or "/"
+        if parts.query:
+            path = f"{path}?{parts.query}"
+        
+        all_headers = {"User-Agent": self.user_agent}
+        all_headers.update(headers or {})
+        
+        # 调度槽位在响应关闭时释放；未能交给 PooledResponse 的路径在 finally 中释放
+        if self.scheduler:
+            self.scheduler.acquire(key[1], priority)
+        handed_off = False
+        try:
+            # 复用的空闲连接可能已被服务端关闭，此时换新连接重试一次；
+            # 第二次强制新建连接，避免再次取到失效的空闲连接后无响应可返回
+            for attempt in range(2):
+                if attempt == 0:
+                    conn, reused = self._acquire(key, timeout)
+                else:
+                    conn, reused = self._new_connection(key, timeout), False
+                target = url if getattr(conn, "_via_proxy", False) else path
+                request_headers = dict(all_headers, **getattr(conn, "_proxy_headers", {}))
+                try:
+                    started = time.monotonic()
+                    timings = {"connection_reused": reused}
+                    if not reused:
+                        # 显式建连以便区分 TCP 与 TLS（含代理隧道）耗时
+                        conn.connect()
+                        timings.update(conn._timings)
+                        if key[0] == "https":
+                            timings["tls_seconds"] = max(0.0, time.monotonic() - started - sum(conn._timings.values()))
+                    conn.request(method, target, headers=request_headers)
+                    response = conn.getresponse()
+                    timings["ttfb_seconds"] = time.monotonic() - started
+                except (http.client.RemoteDisconnected, http.client.BadStatusLine,
+                        ConnectionResetError, BrokenPipeError):
+                    conn.close()
+                    if reused:
+                        continue
+                    raise
+                except Exception:
+                    conn.close()
+                    raise
+                pooled = PooledResponse(self, key, conn, response, url)
+                pooled.timings = timings
+                handed_off = True
+                return pooled
+            raise ConnectionError(f"无法建立到 {key[1]} 的连接")
+        finally:
+            if self.scheduler and not handed_off:
+                self.scheduler.release(key[1])
+    
+    def request(self, method, url, headers=None, timeout=30, priority=TransferScheduler.PRIORITY_METADATA):
+        """发送请求并跟随重定向，状态码 >= 400 时抛出 urllib.error.HTTPError"""
+        for _ in range(self.max_redirects + 1):
+            host = urllib.parse.urlsplit(url).netloc.lower()
+            if self.breaker:
+                self.breaker.before_request(host)
+            try:
+                resp = self._send(method, url, headers, timeout, priority)
+            except Exception as e:
+                if self.breaker:
+                    self.breaker.record(host, not isinstance(e, (OSError, http.client.HTTPException)))
+                raise
+            if self.breaker:
+                self.breaker.record(host, resp.status < 500)
+            if resp.status in self.REDIRECT_CODES and resp.headers.get("Location"):
+                location = urllib.parse.urljoin(url, resp.headers["Location"])
+                resp.read()
+                resp.close()
+                if resp.status == 303 and method != "HEAD":
+                    method = "GET"
+                # 跳转到其他主机时不转发认证信息
+                if headers and urllib.parse.urlsplit(location).netloc.lower() != host:
+                    headers = {k: v for k, v in headers.items() if k.lower() != "authorization"}
+                url = location
+                continue
+            if resp.status >= 400:
+                body = resp.read() if method != "HEAD" else b""
+                resp.close()
+                raise urllib.error.HTTPError(url, resp.status, resp.reason, resp.headers, io.BytesIO(body))
+            return resp
+        raise urllib.error.URLError(f"重定向次数过多: {url}")
+    
+    def close(self):
+        with self._pool_lock:
+            pools, self._pools = self._pools, {}
+        for idle in pools.values():
+            for conn in idle:
+                conn.close()
+
+class PackageHTTPServer(http.server.HTTPServer):
+    """用固定大小线程池处理连接的 HTTP 服务器，数百个客户端同时下载时线程数保持可控"""
+    
+    daemon_threads = True
+    request_queue_size = 128
+    
+    def __init__(self, address, handler, updater, workers=64):
+        self.updater = updater
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="serve")
+        super().__init__(address, handler)
+    
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process_request, request, client_address)
+    
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+    
+    def handle_error(self, request, client_address):
+        # 客户端中途断开属于正常情况，不输出堆栈
+        error = sys.exc_info()[1]
+        if not isinstance(error, (ConnectionError, socket.timeout)):
+            self.updater.log(f"处理 {client_address[0]} 的请求出错: {error}", "WARNING", "⚠️")
+    
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False)
+
+
+class PackageRequestHandler(http.server.BaseHTTPRequestHandler):
+    """以只读方式发布输出目录：sendfile 零拷贝传输，支持 Range 与条件请求"""
+    
+    protocol_version = "HTTP/1.1"
+    server_version = "docker-offline"
+    # 空闲的 keep-alive 连接在超时后释放工作线程
+    timeout = 30
+    CONTENT_TYPES = {".tgz": "application/gzip", ".json": "application/json", ".delta": "application/octet-stream"}
+    
+    def log_message(self, format, *args):
+        self.server.updater.log(f"{self.client_address[0]} {format % args}", "DEBUG", "")
+    
+    def resolve(self, path):
+        """把请求路径映射到输出目录中的文件，拒绝隐藏目录（缓存、存储）与目录穿越"""
+        parts = [part for part in urllib.parse.unquote(path.split("?", 1)[0]).split("/") if part]
+        if any(part.startswith(".") or "\\" in part for part in parts):
+            return None
+        file = self.server.updater.output_dir.joinpath(*parts)
+        return file if parts and file.is_file() else None
+    
+    def index(self):
+        """/ 返回 VERSION.json 内容与 SHA256SUMS 中的文件列表"""
+        output_dir = self.server.updater.output_dir
+        version = self.server.updater.load_json(output_dir / "VERSION.json")
+        try:
+            checksums = self.server.updater.read_checksums(output_dir / "SHA256SUMS")
+        except OSError:
+            checksums = {}
+        files = {}
+        for name, digest in checksums.items():
+            if (output_dir / name).is_file():
+                files[name] = {"sha256": digest, "size": (output_dir / name).stat().st_size}
+        return json.dumps({"version": version, "files": files}, indent=2, ensure_ascii=False).encode("utf-8")
+    
+    def do_HEAD(self):
+        self.do_GET(head=True)
+    
+    def do_GET(self, head=False):
+        if self.path.split("?", 1)[0] in ("/", "/index.json"):
+            body = self.index()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            if not head:
+                self.wfile.write(body)
+            return
+        
+        file = self.resolve(self.path)
+        if file is None:
+            self.send_error(404)
+            return
+        try:
+            fd = os.open(file, os.O_RDONLY)
+        except OSError:
+            self.send_error(404)
+            return
+        try:
+            st = os.fstat(fd)
+            size = st.st_size
+            etag = f'"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"'
+            last_modified = formatdate(st.st_mtime, usegmt=True)
+            
+            def not_modified_since(value):
+                try:
+                    return value is not None and int(st.st_mtime) <= parsedate_to_datetime(value).timestamp()
+                except (TypeError, ValueError, IndexError):
+                    return False
+            
+            # 条件请求：If-None-Match 优先于 If-Modified-Since
+            if_none_match = self.headers.get("If-None-Match")
+            if (if_none_match is not None and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")])
+                    or if_none_match is None and not_modified_since(self.headers.get("If-Modified-Since"))):
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Last-Modified", last_modified)
+                self.end_headers()
+                return
+            
+            start, end = 0, size - 1
+            status = 200
+            range_header = self.headers.get("Range")
+            if_range = self.headers.get("If-Range")
+            # If-Range 必须与 ETag 或 Last-Modified 完全一致，否则忽略 Range 返回完整内容
+            if range_header and if_range and if_range.strip() not in (etag, last_modified):
+                range_header = None
+            # 只支持单个区间；多区间或语法无效（如起点大于终点）的请求按规范忽略，返回完整内容
+            match = re.fullmatch(r"bytes=(\d*)-(\d*)", range_header.strip()) if range_header else None
+            if match and match.group(1) and match.group(2) and int(match.group(1)) > int(match.group(2)):
+                match = None
+            if match and (match.group(1) or match.group(2)):
+                if match.group(1):
+                    start = int(match.group(1))
+                    end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+                else:
+                    start = max(0, size - int(match.group(2)))
+                    if int(match.group(2)) == 0:
+                        start = size
+                # 语法有效但无法满足的区间（起点超出文件、后缀长度为 0）返回 416
+                if start >= size:
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{size}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                status = 206
+            
+            length = end - start + 1 if size else 0
+            self.send_response(status)
+            self.send_header("Content-Type", self.CONTENT_TYPES.get(file.suffix, "application/octet-stream"))
+            self.send_header("Content-Length", str(length))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", last_modified)
+            if status == 206:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            self.end_headers()
+            if not head and length:
+                self.wfile.flush()
+                self.send_file(fd, start, length)
+        finally:
+            os.close(fd)
+    
+    def send_file(self, fd, offset, count):
+        """socket.sendfile 使用 os.sendfile 在内核中直接把文件写入套接字（零拷贝），
+        并处理套接字超时；平台不支持时自动退回到普通读写"""
+        with open(fd, "rb", closefd=False) as f:
+            sent = self.connection.sendfile(f, offset, count)
+        if sent != count:
+            raise ConnectionError("文件在传输过程中被截断")
+
+
 class DockerUpdater:
-    def __init__(self, output_dir="./packages", architectures=None, ci_mode=False):
+    def __init__(self, output_dir="./packages", architectures=None, ci_mode=False, jobs=1,
+                 segments=1, segment_threshold=16 * 1024 * 1024, cache_ttl=600, sync=False,
+                 buffer_size=1024 * 1024, hash_jobs=None, store=False, keep_versions=3,
+                 mirrors=None, mirror_race=3, max_per_host=6, limit_rate=None,
+                 metrics_file=None, prometheus_textfile=None, status_file=None, shard=None,
+                 deltas=False, delta_max_ratio=0.5, channels=None, retries=3, max_retry_wait=300,
+                 github_token=None, breaker_threshold=5, breaker_cooldown=30, write_log=True):
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
         self.ci_mode = ci_mode
+        self.jobs = max(1, jobs)
+        # 大文件分段并行下载：分段数与启用分段的最小文件大小
+        self.segments = max(1, segments)
+        self.segment_threshold = segment_threshold
+        # 下载与哈希使用的读缓冲区大小，每个线程复用一块预分配的缓冲区
+        self.buffer_size = max(64 * 1024, buffer_size)
+        self._buffers = threading.local()
+        # 生成校验和时的并行哈希线程数（hashlib 处理大块数据时会释放 GIL）
+        self.hash_jobs = max(1, hash_jobs or os.cpu_count() or 1)
+        # 增量同步：根据已有 SHA256SUMS 校验本地文件，只重新下载缺失或损坏的文件
+        self.sync = sync
+        self.recorded_checksums = None
         
         self.architectures = architectures or ["x86_64", "aarch64"]
+        # 通道矩阵：{名称: {"docker": 版本规则, "compose": 版本规则, "architectures": [...]}}，为空时只下载最新版本
+        self.channels = channels or {}
         
         self.arch_mapping = {
             "x86_64": {
@@ -55,8 +1138,62 @@ class DockerUpdater:
         self.docker_url_template = "https://download.docker.com/linux/static/stable/{arch}/docker-{version}.tgz"
         self.compose_url_template = "https://github.com/docker/compose/releases/download/v{version}/docker-compose-linux-{arch}"
         self.rootless_url_template = "https://download.docker.com/linux/static/stable/{arch}/docker-rootless-extras-{version}.tgz"
+        self.static_index_template = "https://download.docker.com/linux/static/stable/{arch}/"
+        self.github_api = "https://api.github.com"
+        
+        # 镜像源：{类型: [URL 模板]}，与官方地址一起竞速，按历史表现排序
+        self.mirrors = mirrors or {}
+        self.mirror_race = max(1, mirror_race)
+        self.mirror_stats = None
+        
+        # 控制台输出流（--dry-run 输出计划到 stdout 时改为 stderr）
+        self.console = sys.stdout
+        # serve / apply-delta 作用于发布目录本身，不在其中留下日志文件
+        self.log_file = self.output_dir / f"update_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt" if write_log else None
+        self.log_writer = LogWriter(self.log_file)
+        atexit.register(self.log_writer.close)
+        
+        # 本地状态目录：SHA256 摘要索引等（不随发布包分发）
+        self.cache_dir = self.output_dir / ".cache"
+        self.digest_index_file = self.cache_dir / "digests.json"
+        self.digest_index = None
+        self.mirror_stats_file = self.cache_dir / "mirrors.json"
+        
+        # 分片模式：多个进程/主机分别处理不同架构，只写入部分清单，由 merge 合并
+        self.shard = shard
+        self.shards_dir = self.output_dir / ".shards"
+        
+        # 性能指标：各阶段耗时与每个文件的传输明细，输出为 JSON 报告与可选的 Prometheus textfile
+        default_metrics = f"metrics-{shard}.json" if shard else "metrics.json"
+        self.metrics_file = Path(metrics_file) if metrics_file else self.cache_dir / default_metrics
+        self.prometheus_textfile = Path(prometheus_textfile) if prometheus_textfile else None
+        self.phase_timings = {}
+        self.transfer_metrics = {}
+        
+        # 监视模式状态：写入状态文件，并可通过 HTTP 状态端点读取
+        self.status_file = Path(status_file) if status_file else self.cache_dir / "status.json"
+        self.status = {}
         
-        self.log_file = self.output_dir / f"update_log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+        # 内容寻址存储：按 SHA256 保存文件，每个版本一个硬链接视图，支持快速回滚
+        self.store = store
+        self.keep_versions = max(1, keep_versions)
+        self.store_dir = self.output_dir / ".store"
+        
+        # 差量补丁：为离线站点生成从旧版本到新版本的补丁，补丁大于原文件该比例时不发布
+        self.deltas = deltas
+        self.delta_max_ratio = delta_max_ratio
+        self.deltas_dir = self.output_dir / "deltas"
+        
+        # 元数据缓存：进程内缓存 + 带 TTL 的磁盘缓存，过期后发送条件请求重新验证
+        self.cache_ttl = cache_ttl
+        self.metadata_cache_file = self.cache_dir / "metadata.json"
+        self.metadata_cache = None
+        self._metadata_memo = {}
+        self._metadata_locks = {}
+        self._url_exists_memo = {}
+        self._resolved_versions = {}
+        self._static_versions = {}
+        self._canonical_digests = {}
         
         self.download_stats = {
             'success': 0,
@@ -64,6 +1201,22 @@ class DockerUpdater:
             'skipped': 0,
             'total_size': 0
         }
+        # 并发下载时保护统计数据与日志输出
+        self._lock = threading.RLock()
+        
+        # 所有上游请求共享的重试策略与按主机的熔断器；GitHub API 可选使用令牌认证以提高速率限制
+        self.retry_policy = RetryPolicy(attempts=retries, max_wait=max_retry_wait)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+        self.github_token = github_token
+        
+        # 所有上游请求共享的 keep-alive 连接池，由调度器控制每个主机的并发数与总带宽
+        self.scheduler = TransferScheduler(max_per_host, limit_rate)
+        self.session = HTTPSession(scheduler=self.scheduler, breaker=self.breaker)
+    
+    def record_stat(self, key, value=1):
+        """线程安全地累加下载统计"""
+        with self._lock:
+            self.download_stats[key] += value
     
     def log(self, message, level="INFO", icon=""):
         """输出日志消息"""
@@ -98,14 +1251,12 @@ class DockerUpdater:
         else:
             output = f"{Colors.TIMESTAMP}{timestamp}{Colors.RESET} {color}{level_padded}{Colors.RESET} {icon_str}{message}"
         
-        print(output)
+        with self._lock:
+            print(output, file=self.console)
         
-        # 写入日志文件（移除颜色代码）
-        clean_message = message
-        for color_code in [Colors.KEY, Colors.VALUE, Colors.RESET, Colors.DIMMED]:
-            clean_message = clean_message.replace(color_code, "")
-        with open(self.log_file, "a", encoding="utf-8") as f:
-            f.write(f"[{timestamp}] [{level}] {clean_message}\n")
+        # 写入日志文件（移除颜色代码），由后台线程批量落盘
+        clean_message = ANSI_ESCAPE_RE.sub("", message)
+        self.log_writer.write(f"[{timestamp}] [{level}] {clean_message}\n")
     
     def set_output(self, name, value):
         """设置 GitHub Actions 输出变量"""
@@ -113,110 +1264,225 @@ class DockerUpdater:
             with open(os.getenv('GITHUB_OUTPUT'), 'a') as f:
                 f.write(f"{name}={value}\n")
     
+    def describe_error(self, error):
+        """生成便于排查的错误说明，GitHub 速率限制时给出重置时间与令牌提示"""
+        if isinstance(error, urllib.error.HTTPError):
+            message = f"HTTP {error.code}"
+            reset = (error.headers.get("X-RateLimit-Reset") or "") if error.headers else ""
+            if error.headers and error.headers.get("X-RateLimit-Remaining") == "0" and reset.isdigit():
+                message += f"，API 速率限制将在 {datetime.fromtimestamp(int(reset)).strftime('%H:%M:%S')} 重置"
+                if not self.github_token:
+                    message += "（设置 GITHUB_TOKEN 环境变量可提高限额）"
+            return message
+        return str(error) or type(error).__name__
+    
+    def with_retry(self, description, func):
+        """按共享重试策略执行上游请求；不可重试的错误或重试耗尽时抛出最后一次的异常"""
+        for attempt in range(self.retry_policy.attempts):
+            try:
+                return func()
+            except Exception as e:
+                if attempt == self.retry_policy.attempts - 1 or not self.retry_policy.is_retryable(e):
+                    raise
+                try:
+                    wait = self.retry_policy.delay(attempt, e)
+                except UpstreamError as wait_error:
+                    raise UpstreamError(f"{self.describe_error(e)}，{wait_error}") from e
+                self.log(f"{description} 失败 ({self.describe_error(e)})，{Colors.VALUE}{wait:.1f}{Colors.RESET} 秒后重试 "
+                         f"({attempt + 2}/{self.retry_policy.attempts})", "WARNING", "⏳")
+                time.sleep(wait)
+    
     def check_url_exists(self, url):
-        try:
-            req = urllib.request.Request(url, method="HEAD")
-            req.add_header('User-Agent', 'Mozilla/5.0')
-            with urllib.request.urlopen(req, timeout=20) as _:
-                return True
-        except Exception:
-            return False
+        if url in self._url_exists_memo:
+            return self._url_exists_memo[url]
+        # 已发布的版本文件不会消失，存在性结果在 TTL 内直接复用
+        cache = self.load_metadata_cache()
+        key = f"HEAD {url}"
+        entry = cache.get(key)
+        if entry and time.time() - entry.get("fetched_at", 0) < self.cache_ttl:
+            exists = True
+        else:
+            try:
+                self.with_retry(f"检查 {url}", lambda: self.session.request("HEAD", url, timeout=20).close())
+                exists = True
+            except urllib.error.HTTPError as e:
+                # 明确的 4xx 表示文件不存在；5xx、限流与网络错误不能当作不存在，否则会悄悄回退到其他版本
+                if e.code >= 500 or self.retry_policy.is_retryable(e):
+                    raise UpstreamError(f"无法确认 {url} 是否存在: {self.describe_error(e)}") from e
+                exists = False
+            except UpstreamError:
+                raise
+            except (OSError, http.client.HTTPException) as e:
+                raise UpstreamError(f"无法确认 {url} 是否存在: {self.describe_error(e)}") from e
+            if exists:
+                with self._lock:
+                    cache[key] = {"fetched_at": time.time()}
+        self._url_exists_memo[url] = exists
+        return exists
+    
+    def load_metadata_cache(self):
+        with self._lock:
+            if self.metadata_cache is None:
+                self.metadata_cache = self.load_json(self.metadata_cache_file, {})
+            return self.metadata_cache
+    
+    def save_metadata_cache(self):
+        if self.metadata_cache is None:
+            return
+        
+        def merge(on_disk, ours):
+            # 同一条目保留较新的抓取结果
+            for key, entry in on_disk.items():
+                if entry.get("fetched_at", 0) > ours.get(key, {}).get("fetched_at", 0):
+                    ours[key] = entry
+            return ours
+        
+        with self._lock:
+            self.save_shared_json(self.metadata_cache_file, self.metadata_cache, merge, indent=None)
+    
+    def fetch_metadata(self, url, headers=None, revalidate=False):
+        """获取索引页或 API 响应文本，优先使用缓存，过期或 revalidate 时使用 ETag/Last-Modified 条件请求"""
+        with self._lock:
+            if url in self._metadata_memo:
+                return self._metadata_memo[url]
+            url_lock = self._metadata_locks.setdefault(url, threading.Lock())
+        
+        # 同一 URL 并发请求时只发起一次
+        with url_lock:
+            if url in self._metadata_memo:
+                return self._metadata_memo[url]
+            
+            cache = self.load_metadata_cache()
+            entry = cache.get(url)
+            now = time.time()
+            if entry and not revalidate and now - entry.get("fetched_at", 0) < self.cache_ttl:
+                body = entry["body"]
+            else:
+                request_headers = dict(headers or {})
+                if entry and entry.get("etag"):
+                    request_headers['If-None-Match'] = entry["etag"]
+                if entry and entry.get("last_modified"):
+                    request_headers['If-Modified-Since'] = entry["last_modified"]
+                
+                def fetch():
+                    with self.session.request("GET", url, headers=request_headers, timeout=30) as resp:
+                        body = None if resp.status == 304 and entry else resp.read().decode()
+                        return body, resp.headers.get('ETag'), resp.headers.get('Last-Modified')
+                
+                body, etag, last_modified = self.with_retry(f"请求 {url}", fetch)
+                if body is None:
+                    # 上游未变化，沿用缓存内容
+                    body = entry["body"]
+                    etag = etag or entry.get("etag")
+                    last_modified = last_modified or entry.get("last_modified")
+                with self._lock:
+                    cache[url] = {
+                        "body": body,
+                        "etag": etag,
+                        "last_modified": last_modified,
+                        "fetched_at": now,
+                    }
+            
+            with self._lock:
+                self._metadata_memo[url] = body
+            return body
+    
+    def fetch_github_json(self, path, revalidate=False):
+        url = f"{self.github_api}{path}"
+        headers = {'Accept': 'application/vnd.github.v3+json'}
+        if self.github_token:
+            headers['Authorization'] = f"Bearer {self.github_token}"
+        return json.loads(self.fetch_metadata(url, headers, revalidate))
+    
+    def parse_static_versions(self, html, prefix):
+        versions = re.findall(re.escape(prefix) + r'(\d+\.\d+\.\d+)\.tgz', html)
+        return sorted(set(versions), key=lambda v: tuple(map(int, v.split('.'))), reverse=True)
+    
+    def static_versions(self, arch, prefix):
+        """返回静态索引中的版本列表；每个架构的索引页只获取并解析一次，所有通道共享"""
+        key = (arch, prefix)
+        with self._lock:
+            if key in self._static_versions:
+                return self._static_versions[key]
+        # 静态索引页在 docker 与 rootless 版本查询之间共享缓存
+        html = self.fetch_metadata(self.static_index_template.format(arch=arch))
+        versions = self.parse_static_versions(html, prefix)
+        with self._lock:
+            self._static_versions[key] = versions
+        return versions
+    
+    def not_found_or_raise(self, message, error):
+        """上游明确返回 404 时记录日志并正常返回；限流、熔断与网络故障以 UpstreamError 抛出，避免被误判为文件不存在"""
+        message = f"{message}: {self.describe_error(error)}"
+        if not (isinstance(error, urllib.error.HTTPError) and error.code == 404):
+            raise UpstreamError(message) from error
+        self.log(message, "ERROR", "✗")
     
     def list_static_versions(self, arch):
         try:
-            index_url = f"https://download.docker.com/linux/static/stable/{arch}/"
-            req = urllib.request.Request(index_url)
-            req.add_header('User-Agent', 'Mozilla/5.0')
-            with urllib.request.urlopen(req, timeout=30) as resp:
-                html = resp.read().decode()
-            import re
-            versions = re.findall(r'docker-(\d+\.\d+\.\d+)\.tgz', html)
-            versions = sorted(set(versions), key=lambda v: tuple(map(int, v.split('.'))), reverse=True)
-            return versions
+            return self.static_versions(arch, "docker-")
         except Exception as e:
-            self.log(f"列举静态版本失败: {e}", "ERROR", "✗")
+            self.not_found_or_raise("列举静态版本失败", e)
             return []
     
     def list_rootless_versions(self, arch):
         try:
-            index_url = f"https://download.docker.com/linux/static/stable/{arch}/"
-            req = urllib.request.Request(index_url)
-            req.add_header('User-Agent', 'Mozilla/5.0')
-            with urllib.request.urlopen(req, timeout=30) as resp:
-                html = resp.read().decode()
-            import re
-            versions = re.findall(r'docker-rootless-extras-(\d+\.\d+\.\d+)\.tgz', html)
-            versions = sorted(set(versions), key=lambda v: tuple(map(int, v.split('.'))), reverse=True)
-            return versions
+            return self.static_versions(arch, "docker-rootless-extras-")
         except Exception as e:
-            self.log(f"列举 rootless 版本失败: {e}", "ERROR", "✗")
+            self.not_found_or_raise("列举 rootless 版本失败", e)
             return []
     
     def resolve_static_version_for_arch(self, arch, desired_version):
+        key = (arch, desired_version)
+        if key in self._resolved_versions:
+            return self._resolved_versions[key]
+        resolved = desired_version
         docker_url = self.docker_url_template.format(arch=arch, version=desired_version)
-        if self.check_url_exists(docker_url):
-            return desired_version
-        avail = self.list_static_versions(arch)
-        if avail:
-            fallback = avail[0]
-            self.log(f"目标版本 {Colors.KEY}{desired_version}{Colors.RESET} 不存在，{arch} 回退到可用版本 {Colors.VALUE}{fallback}{Colors.RESET}", "WARNING", "⊘")
-            return fallback
-        self.log(f"{arch} 未发现任何可用静态版本，继续尝试目标版本 {Colors.KEY}{desired_version}{Colors.RESET}", "ERROR", "✗")
-        return desired_version
+        if not self.check_url_exists(docker_url):
+            avail = self.list_static_versions(arch)
+            if avail:
+                resolved = avail[0]
+                self.log(f"目标版本 {Colors.KEY}{desired_version}{Colors.RESET} 不存在，{arch} 回退到可用版本 {Colors.VALUE}{resolved}{Colors.RESET}", "WARNING", "⊘")
+            else:
+                self.log(f"{arch} 未发现任何可用静态版本，继续尝试目标版本 {Colors.KEY}{desired_version}{Colors.RESET}", "ERROR", "✗")
+        self._resolved_versions[key] = resolved
+        return resolved
     
     def get_latest_docker_version(self):
         """获取最新的 Docker 版本号"""
         try:
             self.log("正在获取最新 Docker 版本...", "INFO", "🔍")
-            url = "https://api.github.com/repos/moby/moby/releases/latest"
-            req = urllib.request.Request(url)
-            req.add_header('User-Agent', 'Mozilla/5.0')
-            req.add_header('Accept', 'application/vnd.github.v3+json')
-            
-            with urllib.request.urlopen(req, timeout=30) as response:
-                data = json.loads(response.read().decode())
-                tag = data['tag_name']
-                import re
-                m = re.search(r'(\d+\.\d+\.\d+)', tag)
-                version = m.group(1) if m else tag.lstrip('v').replace('docker-', '').replace('engine-', '')
-                self.log(f"找到最新 Docker 版本: {Colors.VALUE}{version}{Colors.RESET}", "NOTICE", "✓")
-                self.set_output('docker_version', version)
-                return version
+            data = self.fetch_github_json("/repos/moby/moby/releases/latest")
+            tag = data['tag_name']
+            m = re.search(r'(\d+\.\d+\.\d+)', tag)
+            version = m.group(1) if m else tag.lstrip('v').replace('docker-', '').replace('engine-', '')
+            self.log(f"找到最新 Docker 版本: {Colors.VALUE}{version}{Colors.RESET}", "NOTICE", "✓")
+            return version
         except Exception as e:
-            self.log(f"获取 Docker 版本失败: {e}", "ERROR", "✗")
-            return "27.4.1"
+            # 不再回退到写死的版本号，避免在上游故障或限流时悄悄下载过期版本
+            message = f"获取 Docker 版本失败: {self.describe_error(e)}"
+            self.log(message, "ERROR", "✗")
+            raise UpstreamError(message) from e
     
     def get_latest_compose_version(self):
         """获取最新的 Docker Compose 版本号"""
         try:
             self.log("正在获取最新 Docker Compose 版本...", "INFO", "🔍")
-            url = "https://api.github.com/repos/docker/compose/releases/latest"
-            req = urllib.request.Request(url)
-            req.add_header('User-Agent', 'Mozilla/5.0')
-            req.add_header('Accept', 'application/vnd.github.v3+json')
-            
-            with urllib.request.urlopen(req, timeout=30) as response:
-                data = json.loads(response.read().decode())
+            data = self.fetch_github_json("/repos/docker/compose/releases/latest")
             tag = data['tag_name']
-            import re
             m = re.search(r'(\d+\.\d+\.\d+)', tag)
             version = m.group(1) if m else tag.lstrip('v')
             self.log(f"找到最新 Docker Compose 版本: {Colors.VALUE}{version}{Colors.RESET}", "NOTICE", "✓")
-            self.set_output('compose_version', version)
             return version
         except Exception as e:
-            self.log(f"获取 Docker Compose 版本失败: {e}", "ERROR", "✗")
-            return "2.32.4"
+            message = f"获取 Docker Compose 版本失败: {self.describe_error(e)}"
+            self.log(message, "ERROR", "✗")
+            raise UpstreamError(message) from e
     
     def get_compose_asset_url(self, version, arch):
         try:
             tag = f"v{version}"
-            api = f"https://api.github.com/repos/docker/compose/releases/tags/{tag}"
-            req = urllib.request.Request(api)
-            req.add_header('User-Agent', 'Mozilla/5.0')
-            req.add_header('Accept', 'application/vnd.github.v3+json')
-            with urllib.request.urlopen(req, timeout=30) as resp:
-                data = json.loads(resp.read().decode())
+            data = self.fetch_github_json(f"/repos/docker/compose/releases/tags/{tag}")
             assets = data.get('assets', [])
             names = [f"docker-compose-linux-{arch}", f"docker-compose-linux-{arch}.exe"]
             alt = {"x86_64": ["amd64"], "aarch64": ["arm64"]}.get(arch, [])
@@ -233,28 +1499,394 @@ class DockerUpdater:
                         return url
             return None
         except Exception as e:
-            self.log(f"获取 Compose 资源失败: {e}", "ERROR", "✗")
+            self.not_found_or_raise(f"获取 Compose {version} 资源失败", e)
             return None
     
+    def get_buffer(self):
+        """返回当前线程复用的读缓冲区 (memoryview)"""
+        view = getattr(self._buffers, "view", None)
+        if view is None or len(view) != self.buffer_size:
+            view = memoryview(bytearray(self.buffer_size))
+            self._buffers.view = view
+        return view
+    
+    def update_hash_from_file(self, hash_obj, filepath):
+        """使用 readinto 将文件内容读入复用缓冲区并更新哈希，避免每块分配新对象"""
+        view = self.get_buffer()
+        with open(filepath, 'rb', buffering=0) as f:
+            while True:
+                n = f.readinto(view)
+                if not n:
+                    break
+                hash_obj.update(view[:n])
+        return hash_obj
+    
     def calculate_file_hash(self, filepath, algorithm='sha256'):
         """计算文件哈希值"""
-        hash_obj = hashlib.new(algorithm)
-        with open(filepath, 'rb') as f:
-            for chunk in iter(lambda: f.read(8192), b''):
-                hash_obj.update(chunk)
-        return hash_obj.hexdigest()
-    
-    def download_file(self, url, filename, description, max_retries=3):
-        """下载文件并显示进度，支持重试"""
+        if hasattr(hashlib, 'file_digest'):
+            # Python 3.11+ 在 C 层完成读取与哈希
+            with open(filepath, 'rb', buffering=0) as f:
+                return hashlib.file_digest(f, algorithm).hexdigest()
+        return self.update_hash_from_file(hashlib.new(algorithm), filepath).hexdigest()
+    
+    def parse_content_range(self, value):
+        """解析 Content-Range 头，返回 (起始字节, 文件总大小)"""
+        try:
+            unit, _, spec = value.partition(" ")
+            byte_range, _, total = spec.partition("/")
+            start = int(byte_range.split("-")[0])
+            return start, (int(total) if total and total != "*" else 0)
+        except (AttributeError, ValueError):
+            return None, 0
+    
+    def load_part_validator(self, part_path, meta_path, url):
+        """读取 .part 文件对应的校验器 (ETag/Last-Modified)，无法安全续传时丢弃 .part"""
+        meta = self.load_json(meta_path, {}) if meta_path.exists() else {}
+        validator = meta.get("validator") if isinstance(meta, dict) and meta.get("url") == url else None
+        if validator is None:
+            for path in (part_path, meta_path):
+                if path.exists():
+                    path.unlink()
+        return validator
+    
+    def save_part_validator(self, meta_path, url, validator):
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump({"url": url, "validator": validator}, f)
+    
+    def load_digest_index(self):
+        """读取摘要索引 {文件名: {sha256, size, mtime_ns, ino}}"""
+        with self._lock:
+            if self.digest_index is None:
+                self.digest_index = self.load_json(self.digest_index_file, {})
+            return self.digest_index
+    
+    def save_digest_index(self):
+        if self.digest_index is None:
+            return
+        
+        def merge(on_disk, ours):
+            # 其他进程记录的条目在文件仍存在时保留，已删除文件的条目随之丢弃
+            for name, entry in on_disk.items():
+                if name not in ours and (self.output_dir / name).is_file():
+                    ours[name] = entry
+            return ours
+        
+        with self._lock:
+            self.save_shared_json(self.digest_index_file, self.digest_index, merge, sort_keys=True)
+    
+    def record_digest(self, filepath, digest):
+        """记录文件摘要及其 stat 信息，stat 未变化时无需重新计算"""
+        st = filepath.stat()
+        index = self.load_digest_index()
+        with self._lock:
+            index[filepath.name] = {
+                "sha256": digest,
+                "size": st.st_size,
+                "mtime_ns": st.st_mtime_ns,
+                "ino": st.st_ino,
+            }
+    
+    def get_file_digest(self, filepath):
+        """返回文件 SHA256，仅当大小、修改时间或 inode 变化时才重新读取文件"""
+        st = filepath.stat()
+        entry = self.load_digest_index().get(filepath.name)
+        if (entry and entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns
+                and entry.get("ino") == st.st_ino):
+            return entry["sha256"]
+        digest = self.calculate_file_hash(filepath)
+        self.record_digest(filepath, digest)
+        return digest
+    
+    def load_recorded_checksums(self):
+        """读取现有 SHA256SUMS，返回 {文件名: sha256}"""
+        with self._lock:
+            if self.recorded_checksums is None:
+                try:
+                    self.recorded_checksums = self.read_checksums(self.output_dir / "SHA256SUMS")
+                except OSError:
+                    self.recorded_checksums = {}
+            return self.recorded_checksums
+    
+    def verify_existing_file(self, filepath):
+        """校验已存在的文件是否与记录的摘要一致，stat 未变化时不重新计算哈希"""
+        entry = self.load_digest_index().get(filepath.name)
+        recorded = self.load_recorded_checksums().get(filepath.name) or (entry or {}).get("sha256")
+        digest = self.get_file_digest(filepath)
+        if recorded is None:
+            self.log(f"  → {filepath.name} 没有记录的摘要，已登记当前 SHA256", "DEBUG", "")
+            return True
+        return digest == recorded
+    
+    def transfer_metric(self, filename):
+        """返回文件的传输指标记录，不存在时创建"""
+        with self._lock:
+            return self.transfer_metrics.setdefault(filename, {
+                "url": None,
+                "status": None,
+                "mode": None,
+                "bytes": 0,
+                "duration_seconds": 0.0,
+                "throughput_bytes_per_second": 0.0,
+                "attempts": 0,
+                "retries": 0,
+                "backoff_seconds": 0.0,
+                "hash_seconds": 0.0,
+                "dns_seconds": None,
+                "connect_seconds": None,
+                "tls_seconds": None,
+                "ttfb_seconds": None,
+                "connection_reused": None,
+            })
+    
+    def add_transfer_metric(self, filename, key, value):
+        with self._lock:
+            self.transfer_metric(filename)[key] += value
+    
+    def is_archive(self, filename):
+        return str(filename).endswith(".tgz")
+    
+    def manifest_path(self, filepath):
+        return filepath.with_name(filepath.name + ".manifest.json")
+    
+    def scan_archive(self, filepath):
+        """完整读取一个本地 tar.gz 文件进行校验，返回成员清单"""
+        validator = TarStreamValidator()
+        try:
+            self.update_hash_from_file(validator, filepath)
+        finally:
+            validator.close()
+        return validator.finish()
+    
+    def write_manifest(self, filepath, manifest, file_hash):
+        """写入归档成员清单，供 install.sh 直接按 strip_components 解压"""
+        data = {"archive": filepath.name, "sha256": file_hash}
+        data.update(manifest)
+        self.save_json(self.manifest_path(filepath), data)
+    
+    def finish_download(self, part_path, meta_path, filepath, description, file_hash=None, manifest=None):
+        """将下载完整的 .part 文件重命名为正式文件并记录统计"""
+        os.replace(part_path, filepath)
+        if meta_path.exists():
+            meta_path.unlink()
+        
+        # 流式下载时已边下载边计算哈希，分段下载需在组装完成后计算
+        if file_hash is None:
+            hash_started = time.perf_counter()
+            file_hash = self.calculate_file_hash(filepath)
+            self.add_transfer_metric(filepath.name, "hash_seconds", time.perf_counter() - hash_started)
+        self.record_digest(filepath, file_hash)
+        if manifest is not None:
+            self.write_manifest(filepath, manifest, file_hash)
+        file_size = filepath.stat().st_size
+        file_size_mb = file_size / (1024 * 1024)
+        
+        self.log(f"{description} 下载完成", "SUCCESS", "✓")
+        self.log(f"  → 文件路径: {Colors.VALUE}{filepath}{Colors.RESET}", "DEBUG", "")
+        self.log(f"  → 文件大小: {Colors.VALUE}{file_size_mb:.2f} MB{Colors.RESET}", "DEBUG", "")
+        self.log(f"  → SHA256: {Colors.DIMMED}{file_hash}{Colors.RESET}", "DEBUG", "")
+        
+        self.record_stat('success')
+        self.record_stat('total_size', file_size)
+    
+    def probe_download(self, url):
+        """通过 HEAD 请求获取文件大小、校验器以及是否支持 Range"""
+        with self.session.request("HEAD", url, timeout=20) as resp:
+            size = int(resp.headers.get('content-length', 0))
+            accepts_ranges = resp.headers.get('Accept-Ranges', '').lower() == 'bytes'
+            etag = resp.headers.get('ETag')
+            validator = etag if etag and not etag.startswith('W/') else resp.headers.get('Last-Modified')
+        return size, validator, accepts_ranges
+    
+    def write_at(self, fd, data, offset):
+        """在文件指定偏移处写入数据，多个分段线程可共享同一个文件描述符"""
+        if hasattr(os, 'pwrite'):
+            view = memoryview(data)
+            while view:
+                written = os.pwrite(fd, view, offset)
+                view = view[written:]
+                offset += written
+        else:
+            with self._lock:
+                os.lseek(fd, offset, os.SEEK_SET)
+                os.write(fd, data)
+    
+    def download_segment(self, url, fd, start, end, validator, label, max_retries, priority, filename):
+        """下载 [start, end] 字节区间，失败时只重试该分段的剩余部分"""
+        pos = start
+        view = self.get_buffer()
+        for attempt in range(max_retries):
+            last_error = None
+            try:
+                headers = {'Range': f"bytes={pos}-{end}"}
+                if validator:
+                    headers['If-Range'] = validator
+                self.add_transfer_metric(filename, "attempts", 1)
+                with self.session.request("GET", url, headers=headers, timeout=120, priority=priority) as response:
+                    with self._lock:
+                        self.transfer_metric(filename).update(response.timings)
+                    range_start, _ = self.parse_content_range(response.headers.get('content-range'))
+                    if response.status != 206 or range_start != pos:
+                        raise IOError(f"服务端未返回预期的分段数据 (HTTP {response.status})")
+                    while pos <= end:
+                        n = response.readinto(view[:min(len(view), end - pos + 1)])
+                        if not n:
+                            break
+                        self.write_at(fd, view[:n], pos)
+                        self.add_transfer_metric(filename, "bytes", n)
+                        pos += n
+                if pos > end:
+                    return True
+                raise IOError(f"分段数据不完整: {pos - start}/{end - start + 1} bytes")
+            except urllib.error.HTTPError as e:
+                self.log(f"{label} HTTP 错误 {e.code}", "ERROR", "✗")
+                if e.code in (404, 412, 416):
+                    return False
+                last_error = e
+            except Exception as e:
+                self.log(f"{label} 下载失败: {e}", "ERROR", "✗")
+                last_error = e
+            
+            if last_error is not None and not self.retry_policy.is_retryable(last_error):
+                return False
+            if attempt < max_retries - 1:
+                try:
+                    wait_time = self.retry_policy.delay(attempt, last_error)
+                except UpstreamError as e:
+                    self.log(f"{label} {e}", "ERROR", "✗")
+                    return False
+                self.log(f"{label} 等待 {Colors.VALUE}{wait_time:.1f}{Colors.RESET} 秒后从 {Colors.VALUE}{pos}{Colors.RESET} 字节处重试...", "INFO", "⏳")
+                self.add_transfer_metric(filename, "backoff_seconds", wait_time)
+                self.add_transfer_metric(filename, "retries", 1)
+                time.sleep(wait_time)
+        return False
+    
+    def download_segmented(self, url, part_path, meta_path, filepath, description, max_retries, priority):
+        """分段并行下载到预分配的 .part 文件；不适用分段模式时返回 None"""
+        try:
+            total_size, validator, accepts_ranges = self.probe_download(url)
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                self.log(f"HTTP 错误 {e.code}: {description}", "ERROR", "✗")
+                return False
+            self.log(f"  → 分段探测失败，改用单连接下载: HTTP {e.code}", "DEBUG", "")
+            return None
+        except Exception as e:
+            self.log(f"  → 分段探测失败，改用单连接下载: {e}", "DEBUG", "")
+            return None
+        if not accepts_ranges or total_size < max(self.segment_threshold, self.segments):
+            return None
+        
+        segment_size = -(-total_size // self.segments)
+        ranges = [(start, min(start + segment_size, total_size) - 1)
+                  for start in range(0, total_size, segment_size)]
+        
+        self.log(f"开始分段下载 {description} ({Colors.VALUE}{len(ranges)}{Colors.RESET} 段)...", "INFO", "📥")
+        self.transfer_metric(filepath.name)["mode"] = "segmented"
+        self.log(f"  → URL: {Colors.DIMMED}{url}{Colors.RESET}", "DEBUG", "")
+        
+        fd = os.open(part_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            if hasattr(os, 'posix_fallocate'):
+                try:
+                    os.posix_fallocate(fd, 0, total_size)
+                except OSError:
+                    os.ftruncate(fd, total_size)
+            else:
+                os.ftruncate(fd, total_size)
+            
+            with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+                futures = [
+                    pool.submit(self.download_segment, url, fd, start, end, validator,
+                                f"{description} 分段 {index + 1}/{len(ranges)}", max_retries, priority, filepath.name)
+                    for index, (start, end) in enumerate(ranges)
+                ]
+                results = [future.result() for future in futures]
+        finally:
+            os.close(fd)
+        
+        if not all(results) or part_path.stat().st_size != total_size:
+            self.log(f"{description} 分段下载失败", "ERROR", "✗")
+            part_path.unlink()
+            return False
+        
+        manifest = None
+        if self.is_archive(filepath.name):
+            try:
+                manifest = self.scan_archive(part_path)
+            except ArchiveError as e:
+                self.log(f"{description} {e}", "ERROR", "✗")
+                part_path.unlink()
+                return False
+        
+        self.finish_download(part_path, meta_path, filepath, description, manifest=manifest)
+        return True
+    
+    def report_progress(self, description, downloaded, total_size, log_progress):
+        percent = (downloaded / total_size) * 100
+        if log_progress:
+            self.log(f"{description} 下载进度: {Colors.VALUE}{percent:.1f}%{Colors.RESET} ({downloaded}/{total_size} bytes)", "DEBUG", "📊")
+        else:
+            with self._lock:
+                print(f"\r{Colors.DIMMED}  → 下载进度: {Colors.VALUE}{percent:.1f}%{Colors.RESET} ({Colors.VALUE}{downloaded}/{total_size}{Colors.RESET} bytes){Colors.RESET}", end='', flush=True, file=self.console)
+    
+    def download_file(self, url, filename, description, max_retries=None, priority=TransferScheduler.PRIORITY_BULK):
+        """下载文件并记录传输耗时、吞吐量与重试等指标；max_retries 默认取共享重试策略的尝试次数"""
+        if max_retries is None:
+            max_retries = self.retry_policy.attempts
+        metric = self.transfer_metric(filename)
+        metric["url"] = url
+        started = time.monotonic()
+        success = self.transfer_file(url, filename, description, max_retries, priority)
+        with self._lock:
+            if metric["status"] != "skipped" or not success:
+                metric["status"] = "success" if success else "failed"
+            metric["duration_seconds"] += time.monotonic() - started
+            active = metric["duration_seconds"] - metric["backoff_seconds"]
+            metric["throughput_bytes_per_second"] = metric["bytes"] / active if active > 0 else 0.0
+        return success
+    
+    def transfer_file(self, url, filename, description, max_retries, priority):
+        """下载文件并显示进度，支持重试与断点续传"""
+        metric = self.transfer_metric(filename)
         filepath = self.output_dir / filename
+        # 未完成的数据写入 .part 文件，下载完整后才重命名为正式文件
+        part_path = self.output_dir / f"{filename}.part"
+        meta_path = self.output_dir / f"{filename}.part.json"
         
         # 检查文件是否已存在
-        if filepath.exists():
+        if filepath.exists() and self.is_archive(filename) and not self.manifest_path(filepath).exists():
+            try:
+                self.write_manifest(filepath, self.scan_archive(filepath), self.get_file_digest(filepath))
+            except ArchiveError as e:
+                self.log(f"已有文件 {Colors.KEY}{filename}{Colors.RESET} {e}，重新下载", "WARNING", "⚠️")
+                filepath.unlink()
+        if filepath.exists() and not self.sync:
             self.log(f"文件已存在，跳过下载: {Colors.KEY}{filename}{Colors.RESET}", "WARNING", "⊘")
-            self.download_stats['skipped'] += 1
+            self.record_stat('skipped')
+            metric["status"] = "skipped"
             return True
+        if filepath.exists():
+            if self.verify_existing_file(filepath):
+                self.log(f"文件已存在且校验通过，跳过下载: {Colors.KEY}{filename}{Colors.RESET}", "DEBUG", "⊘")
+                self.record_stat('skipped')
+                metric["status"] = "skipped"
+                return True
+            self.log(f"文件校验失败，重新下载: {Colors.KEY}{filename}{Colors.RESET}", "WARNING", "⚠️")
+            filepath.unlink()
+        
+        validator = self.load_part_validator(part_path, meta_path, url)
+        
+        # 没有可续传的 .part 时，大文件优先使用分段并行下载
+        if self.segments > 1 and not part_path.exists():
+            result = self.download_segmented(url, part_path, meta_path, filepath, description, max_retries, priority)
+            if result is not None:
+                if not result:
+                    self.record_stat('failed')
+                return result
         
         for attempt in range(max_retries):
+            archive_validator = None
+            last_error = None
             try:
                 if attempt > 0:
                     self.log(f"重试下载 ({attempt + 1}/{max_retries}): {description}", "INFO", "🔄")
@@ -263,110 +1895,653 @@ class DockerUpdater:
                 
                 self.log(f"  → URL: {Colors.DIMMED}{url}{Colors.RESET}", "DEBUG", "")
                 
-                req = urllib.request.Request(url)
-                req.add_header('User-Agent', 'Mozilla/5.0')
+                offset = part_path.stat().st_size if part_path.exists() else 0
+                headers = {}
+                if offset > 0 and validator:
+                    # If-Range 保证上游文件变化时服务端返回完整内容而不是错位的片段
+                    headers['Range'] = f"bytes={offset}-"
+                    headers['If-Range'] = validator
                 
-                with urllib.request.urlopen(req, timeout=120) as response:
-                    total_size = int(response.headers.get('content-length', 0))
-                    block_size = 8192
-                    downloaded = 0
+                metric["attempts"] += 1
+                with self.session.request("GET", url, headers=headers, timeout=120, priority=priority) as response:
+                    metric.update(response.timings)
+                    content_length = int(response.headers.get('content-length', 0))
+                    range_start, range_total = self.parse_content_range(response.headers.get('content-range'))
+                    if response.status == 206 and range_start == offset:
+                        total_size = range_total or (offset + content_length)
+                        mode = 'ab'
+                        metric["mode"] = "resume"
+                        self.log(f"  → 从 {Colors.VALUE}{offset}{Colors.RESET} 字节处继续下载", "DEBUG", "")
+                    else:
+                        # 服务端忽略了 Range 请求或文件已变化，回退为完整下载
+                        offset = 0
+                        total_size = content_length
+                        mode = 'wb'
+                        metric["mode"] = "stream"
                     
-                    with open(filepath, 'wb') as f:
-                        while True:
-                            buffer = response.read(block_size)
-                            if not buffer:
-                                break
-                            
-                            downloaded += len(buffer)
-                            f.write(buffer)
-                            
-                            # 在 CI 模式下每 10MB 输出一次进度
-                            if self.ci_mode and total_size > 0:
-                                if downloaded % (10 * 1024 * 1024) < block_size:
-                                    percent = (downloaded / total_size) * 100
-                                    self.log(f"下载进度: {Colors.VALUE}{percent:.1f}%{Colors.RESET} ({downloaded}/{total_size} bytes)", "DEBUG", "📊")
-                            elif total_size > 0 and downloaded % (5 * 1024 * 1024) < block_size:
-                                percent = (downloaded / total_size) * 100
-                                print(f"\r{Colors.DIMMED}  → 下载进度: {Colors.VALUE}{percent:.1f}%{Colors.RESET} ({Colors.VALUE}{downloaded}/{total_size}{Colors.RESET} bytes){Colors.RESET}", end='', flush=True)
+                    etag = response.headers.get('ETag')
+                    validator = etag if etag and not etag.startswith('W/') else response.headers.get('Last-Modified')
+                    if validator:
+                        self.save_part_validator(meta_path, url, validator)
+                    elif meta_path.exists():
+                        meta_path.unlink()
                     
-                    if not self.ci_mode and total_size > 0:
-                        print()  # 换行
+                    view = self.get_buffer()
+                    downloaded = offset
                     
-                    # 计算文件哈希
-                    file_hash = self.calculate_file_hash(filepath)
-                    file_size = filepath.stat().st_size
-                    file_size_mb = file_size / (1024 * 1024)
+                    # 按时间节流进度输出：CI/并发模式写日志，终端模式刷新进度条
+                    log_progress = self.ci_mode or self.jobs > 1
+                    progress_interval = 5.0 if log_progress else 0.5
+                    next_report = time.monotonic() + progress_interval
                     
-                    self.log(f"{description} 下载完成", "SUCCESS", "✓")
-                    self.log(f"  → 文件路径: {Colors.VALUE}{filepath}{Colors.RESET}", "DEBUG", "")
-                    self.log(f"  → 文件大小: {Colors.VALUE}{file_size_mb:.2f} MB{Colors.RESET}", "DEBUG", "")
-                    self.log(f"  → SHA256: {Colors.DIMMED}{file_hash}{Colors.RESET}", "DEBUG", "")
+                    # 边下载边计算 SHA256；续传时先补算已下载部分
+                    hash_obj = hashlib.sha256()
+                    hash_seconds = 0.0
+                    if offset > 0:
+                        hash_started = time.perf_counter()
+                        self.update_hash_from_file(hash_obj, part_path)
+                        hash_seconds += time.perf_counter() - hash_started
                     
-                    self.download_stats['success'] += 1
-                    self.download_stats['total_size'] += file_size
+                    # tar.gz 在下载的同时流式解压校验，损坏或截断的归档立即失败重试
+                    if self.is_archive(filename):
+                        archive_validator = TarStreamValidator()
+                        if offset > 0:
+                            self.update_hash_from_file(archive_validator, part_path)
                     
-                    return True
+                    with open(part_path, mode, buffering=0) as f:
+                        while True:
+                            n = response.readinto(view)
+                            if not n:
+                                break
+                            
+                            chunk = view[:n]
+                            downloaded += n
+                            metric["bytes"] += n
+                            f.write(chunk)
+                            hash_started = time.perf_counter()
+                            hash_obj.update(chunk)
+                            hash_seconds += time.perf_counter() - hash_started
+                            if archive_validator:
+                                archive_validator.update(chunk)
+                            
+                            if total_size > 0:
+                                now = time.monotonic()
+                                if now >= next_report:
+                                    next_report = now + progress_interval
+                                    self.report_progress(description, downloaded, total_size, log_progress)
+                    
+                    if not self.ci_mode and self.jobs == 1 and total_size > 0:
+                        print(file=self.console)  # 换行
+                    metric["hash_seconds"] += hash_seconds
+                
+                if total_size > 0 and downloaded != total_size:
+                    raise IOError(f"下载不完整: {downloaded}/{total_size} bytes")
+                
+                manifest = archive_validator.finish() if archive_validator else None
+                self.finish_download(part_path, meta_path, filepath, description, hash_obj.hexdigest(), manifest)
+                return True
                     
+            except ArchiveError as e:
+                # 已下载的数据本身有问题，续传没有意义，丢弃 .part 后重新完整下载
+                self.log(f"{description} {e}", "ERROR", "✗")
+                for path in (part_path, meta_path):
+                    if path.exists():
+                        path.unlink()
+                validator = None
             except urllib.error.HTTPError as e:
                 self.log(f"HTTP 错误 {e.code}: {description}", "ERROR", "✗")
                 if e.code == 404:
-                    self.download_stats['failed'] += 1
+                    self.record_stat('failed')
                     return False
+                if e.code == 416:
+                    # 续传范围无效，丢弃 .part 后重新完整下载
+                    for path in (part_path, meta_path):
+                        if path.exists():
+                            path.unlink()
+                    validator = None
+                else:
+                    last_error = e
             except Exception as e:
+                # 保留 .part 文件，下次重试从断点继续
                 self.log(f"下载失败: {e}", "ERROR", "✗")
-                if filepath.exists():
-                    filepath.unlink()
+                last_error = e
+            finally:
+                if archive_validator is not None:
+                    archive_validator.close()
             
+            # 熔断、认证失败等不可重试的错误直接放弃，交给下一个镜像
+            if last_error is not None and not self.retry_policy.is_retryable(last_error):
+                break
             if attempt < max_retries - 1:
-                import time
-                wait_time = 2 ** attempt
-                self.log(f"等待 {Colors.VALUE}{wait_time}${Colors.RESET} 秒后重试...", "INFO", "⏳")
+                try:
+                    wait_time = self.retry_policy.delay(attempt, last_error)
+                except UpstreamError as e:
+                    self.log(f"{description} {e}", "ERROR", "✗")
+                    break
+                self.log(f"等待 {Colors.VALUE}{wait_time:.1f}{Colors.RESET} 秒后重试...", "INFO", "⏳")
+                metric["backoff_seconds"] += wait_time
+                metric["retries"] += 1
                 time.sleep(wait_time)
         
-        self.download_stats['failed'] += 1
+        self.record_stat('failed')
         return False
     
-    def cleanup_old_versions(self, current_docker_version, current_compose_version, arch):
-        """清理指定架构的旧版本文件"""
+    def mirror_urls(self, kind, arch, version):
+        return [template.format(arch=arch, version=version) for template in self.mirrors.get(kind, [])]
+    
+    def mirror_key(self, url):
+        parts = urllib.parse.urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+    
+    def load_mirror_stats(self):
+        with self._lock:
+            if self.mirror_stats is None:
+                self.mirror_stats = self.load_json(self.mirror_stats_file, {})
+            return self.mirror_stats
+    
+    def save_mirror_stats(self):
+        if self.mirror_stats is None:
+            return
+        
+        def merge(on_disk, ours):
+            for key, entry in on_disk.items():
+                ours.setdefault(key, entry)
+            return ours
+        
+        with self._lock:
+            self.save_shared_json(self.mirror_stats_file, self.mirror_stats, merge)
+    
+    def record_mirror_result(self, url, ok, nbytes=0, seconds=0.0, ttfb=None, mismatch=False):
+        """以指数加权平均记录镜像的吞吐量、首字节延迟与错误率"""
+        stats = self.load_mirror_stats()
+        alpha = 0.3
+        with self._lock:
+            entry = stats.setdefault(self.mirror_key(url), {
+                "throughput": None, "ttfb": None, "error_rate": 0.0, "successes": 0, "errors": 0,
+            })
+            entry["error_rate"] = (1 - alpha) * entry["error_rate"] + alpha * (0.0 if ok else 1.0)
+            if ok:
+                entry["successes"] += 1
+                if nbytes and seconds > 0:
+                    rate = nbytes / seconds
+                    entry["throughput"] = rate if entry["throughput"] is None else (1 - alpha) * entry["throughput"] + alpha * rate
+                if ttfb is not None:
+                    entry["ttfb"] = ttfb if entry["ttfb"] is None else (1 - alpha) * entry["ttfb"] + alpha * ttfb
+            else:
+                entry["errors"] += 1
+                entry["last_error"] = time.time()
+                if mismatch:
+                    entry["last_mismatch"] = entry["last_error"]
+    
+    def rank_sources(self, urls):
+        """按历史表现排序下载源；没有记录的源排在最前，以便获得测速机会"""
+        stats = self.load_mirror_stats()
+        # 24 小时内提供过与官方不一致内容的镜像不参与竞速
+        now = time.time()
+        urls = [
+            url for url in urls
+            if now - stats.get(self.mirror_key(url), {}).get("last_mismatch", 0) > 24 * 3600
+        ]
+        
+        def score(url):
+            entry = stats.get(self.mirror_key(url))
+            if not entry or entry.get("throughput") is None:
+                return float("inf")
+            return entry["throughput"] * (1 - entry["error_rate"])
+        
+        return sorted(urls, key=score, reverse=True)
+    
+    def probe_source(self, url, probe_bytes=256 * 1024):
+        """读取文件开头的一小段数据，返回 (文件总大小, 首字节延迟, 耗时)"""
+        started = time.monotonic()
+        with self.session.request("GET", url, headers={'Range': f"bytes=0-{probe_bytes - 1}"}, timeout=20) as resp:
+            ttfb = time.monotonic() - started
+            _, total_size = self.parse_content_range(resp.headers.get('content-range'))
+            if resp.status != 206 or total_size is None:
+                total_size = int(resp.headers.get('content-length', 0))
+            view = self.get_buffer()
+            received = 0
+            while received < probe_bytes:
+                n = resp.readinto(view[:min(len(view), probe_bytes - received)])
+                if not n:
+                    break
+                received += n
+        elapsed = time.monotonic() - started
+        self.record_mirror_result(url, True, received, elapsed, ttfb)
+        return total_size, ttfb, elapsed
+    
+    def select_source(self, artifact):
+        """并发测速排名靠前的下载源，返回与官方文件大小一致且最快的地址"""
+        canonical = artifact["url"]
+        candidates = self.rank_sources([canonical] + artifact["mirrors"])[:self.mirror_race]
+        
+        def probe(url):
+            try:
+                return self.probe_source(url)
+            except Exception as e:
+                self.record_mirror_result(url, False)
+                self.log(f"  → 镜像测速失败 {Colors.DIMMED}{self.mirror_key(url)}{Colors.RESET}: {e}", "DEBUG", "")
+                return None
+        
+        with ThreadPoolExecutor(max_workers=len(candidates)) as pool:
+            results = dict(zip(candidates, pool.map(probe, candidates)))
+        
+        if canonical in results:
+            expected_size = results[canonical][0] if results[canonical] else None
+        else:
+            try:
+                expected_size = self.probe_download(canonical)[0]
+            except Exception:
+                expected_size = None
+        if not expected_size:
+            return canonical
+        
+        valid = []
+        for url, result in results.items():
+            if result is None:
+                continue
+            if result[0] != expected_size:
+                self.record_mirror_result(url, False, mismatch=True)
+                self.log(f"  → 镜像文件大小与官方不一致，已忽略: {Colors.DIMMED}{self.mirror_key(url)}{Colors.RESET}", "WARNING", "⚠️")
+                continue
+            valid.append((result[2], url))
+        if not valid:
+            return canonical
+        
+        source = min(valid)[1]
+        if source != canonical:
+            self.log(f"  → 选用镜像 {Colors.VALUE}{self.mirror_key(source)}{Colors.RESET} 下载 {artifact['filename']}", "DEBUG", "")
+        return source
+    
+    def fetch_canonical_checksum(self, artifact):
+        """获取官方发布的 SHA256（Compose 在 GitHub 发布 .sha256 文件），没有则返回 None"""
+        if artifact["kind"] != "compose":
+            return None
         try:
-            import re
-            
-            # 清理docker旧版本
-            docker_pattern = f"docker-*-{arch}.tgz"
-            docker_files = list(self.output_dir.glob(docker_pattern))
-            for file in docker_files:
-                match = re.match(r'docker-(\d+\.\d+\.\d+)-.+\.tgz', file.name)
-                if match:
-                    file_version = match.group(1)
-                    if file_version != current_docker_version:
-                        file.unlink()
-                        self.log(f"已删除旧版本: {Colors.VALUE}{file.name}${Colors.RESET}", "DEBUG", "🗑️ ")
-            
-            # 清理docker-rootless-extras旧版本
-            rootless_pattern = f"docker-rootless-extras-*-{arch}.tgz"
-            rootless_files = list(self.output_dir.glob(rootless_pattern))
-            for file in rootless_files:
-                match = re.match(r'docker-rootless-extras-(\d+\.\d+\.\d+)-.+\.tgz', file.name)
-                if match:
-                    file_version = match.group(1)
-                    if file_version != current_docker_version:
+            with self.session.request("GET", artifact["url"] + ".sha256", timeout=20) as resp:
+                text = resp.read().decode().strip()
+        except Exception as e:
+            self.log(f"  → 获取官方校验和失败 {artifact['filename']}: {e}", "DEBUG", "")
+            return None
+        digest = text.split()[0].lower() if text else ""
+        return digest if re.fullmatch(r'[0-9a-f]{64}', digest) else None
+    
+    def canonical_digest(self, artifact):
+        """返回该文件可信的 SHA256：官方发布的校验和，或已发布的 SHA256SUMS 中同名文件的摘要；都没有时返回 None"""
+        filename = artifact["filename"]
+        if filename not in self._canonical_digests:
+            # 摘要索引会记录任意下载结果（包括被拒绝的镜像文件），不能作为可信来源
+            digest = self.fetch_canonical_checksum(artifact) or self.load_recorded_checksums().get(filename)
+            with self._lock:
+                self._canonical_digests[filename] = digest
+        return self._canonical_digests[filename]
+    
+    def verify_against_canonical(self, artifact, filepath):
+        """校验镜像下载的文件与可信摘要完全一致；没有可信摘要时一律拒绝"""
+        expected = self.canonical_digest(artifact)
+        return expected is not None and self.get_file_digest(filepath) == expected
+    
+    def download_from_mirror(self, artifact, source):
+        """从镜像下载并与官方源校验；失败时撤销统计与文件，由调用方改用官方地址"""
+        filepath = self.output_dir / artifact["filename"]
+        started = time.monotonic()
+        # 镜像失败后还会改用官方源，因此比共享重试策略少尝试一次
+        if not self.download_file(source, artifact["filename"], artifact["description"],
+                                  max_retries=max(1, self.retry_policy.attempts - 1),
+                                  priority=self.artifact_priority(artifact)):
+            # 改用官方源重新下载，本次失败不计入统计
+            self.record_stat('failed', -1)
+            self.record_mirror_result(source, False)
+            return False
+        elapsed = time.monotonic() - started
+        
+        try:
+            verified = self.verify_against_canonical(artifact, filepath)
+        except Exception as e:
+            self.log(f"  → 无法与官方源校验: {e}", "WARNING", "⚠️")
+            verified = False
+        if not verified:
+            self.log(f"镜像文件与官方源不一致，已丢弃: {Colors.KEY}{artifact['filename']}{Colors.RESET} ({self.mirror_key(source)})", "ERROR", "✗")
+            size = filepath.stat().st_size
+            filepath.unlink()
+            self.record_stat('success', -1)
+            self.record_stat('total_size', -size)
+            self.record_mirror_result(source, False, mismatch=True)
+            return False
+        
+        self.record_mirror_result(source, True, filepath.stat().st_size, elapsed)
+        return True
+    
+    def cleanup_old_versions(self, keep_files, arch):
+        """清理指定架构中不属于当前计划（任一通道）的旧版本文件"""
+        try:
+            for kind in ("docker", "rootless", "compose"):
+                pattern = self.artifact_version_pattern(kind, arch)
+                for file in sorted(self.output_dir.iterdir()):
+                    if pattern.fullmatch(file.name) and file.name not in keep_files:
                         file.unlink()
                         self.log(f"已删除旧版本: {Colors.VALUE}{file.name}${Colors.RESET}", "DEBUG", "🗑️ ")
             
-            # 清理docker-compose旧版本
-            compose_pattern = f"docker-compose-linux-*-{arch}"
-            compose_files = list(self.output_dir.glob(compose_pattern))
-            for file in compose_files:
-                match = re.match(r'docker-compose-linux-(\d+\.\d+\.\d+)-.+', file.name)
-                if match:
-                    file_version = match.group(1)
-                    if file_version != current_compose_version:
-                        file.unlink()
-                        self.log(f"已删除旧版本: {Colors.VALUE}{file.name}${Colors.RESET}", "DEBUG", "🗑️ ")
+            # 清理归档已被删除的成员清单
+            for manifest in self.output_dir.glob(f"*-{arch}.tgz.manifest.json"):
+                if not manifest.with_name(manifest.name[:-len(".manifest.json")]).exists():
+                    manifest.unlink()
                     
         except Exception as e:
             self.log(f"清理旧文件时出错: {e}", "ERROR", "✗")
     
+    def store_blob_path(self, digest):
+        return self.store_dir / "blobs" / "sha256" / digest[:2] / digest
+    
+    def link_or_copy(self, src, dst):
+        """以硬链接方式原子地放置文件，文件系统不支持硬链接时退回到复制"""
+        if dst.exists() and os.path.samefile(src, dst):
+            return
+        tmp = dst.with_name(dst.name + ".tmp")
+        if tmp.exists():
+            tmp.unlink()
+        try:
+            os.link(src, tmp)
+        except OSError:
+            shutil.copy2(src, tmp)
+        os.replace(tmp, dst)
+    
+    def ingest_into_store(self, filepath):
+        """将文件放入内容寻址存储；内容已存在时用硬链接替换文件本身以去重"""
+        digest = self.get_file_digest(filepath)
+        blob = self.store_blob_path(digest)
+        if not blob.exists():
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            self.link_or_copy(filepath, blob)
+        elif not os.path.samefile(blob, filepath):
+            self.link_or_copy(blob, filepath)
+            self.record_digest(filepath, digest)
+        return digest
+    
+    def read_view(self, view_dir):
+        return self.load_json(view_dir / "view.json")
+    
+    def view_id(self, plan, files):
+        """版本视图标识：Docker 与 Compose 版本加文件集合摘要，任一文件变化（含仅 Compose 更新、通道变化）都产生新视图"""
+        fingerprint = hashlib.sha256("".join(f"{files[name]}  {name}\n" for name in sorted(files)).encode()).hexdigest()
+        return f"{plan['docker_version']}_{plan['compose_version']}_{fingerprint[:8]}"
+    
+    def publish_view(self, plan):
+        """为当前文件集合创建由硬链接组成的版本视图，并记录为当前版本"""
+        views_dir = self.store_dir / "views"
+        
+        files = {}
+        for artifact in plan["artifacts"]:
+            path = self.output_dir / artifact["filename"]
+            for file in (path, self.manifest_path(path)):
+                if file.is_file():
+                    files[file.name] = self.ingest_into_store(file)
+        version = self.view_id(plan, files)
+        view_dir = views_dir / version
+        
+        tmp_dir = views_dir / f".{version}.tmp"
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir)
+        tmp_dir.mkdir(parents=True)
+        for name, digest in files.items():
+            self.link_or_copy(self.store_blob_path(digest), tmp_dir / name)
+        
+        checksums = "".join(
+            f"{files[name]}  {name}\n" for name in sorted(files) if self.is_checksum_candidate(tmp_dir / name)
+        )
+        self.write_atomic(tmp_dir / "SHA256SUMS", checksums)
+        if (self.output_dir / "VERSION.json").exists():
+            shutil.copy2(self.output_dir / "VERSION.json", tmp_dir / "VERSION.json")
+        self.save_json(tmp_dir / "view.json", {
+            "id": version,
+            "docker_version": plan["docker_version"],
+            "compose_version": plan["compose_version"],
+            "channels": sorted(plan.get("channels") or {}),
+            "architectures": plan["architectures"],
+            "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "timestamp": time.time(),
+            "files": files,
+        })
+        
+        if view_dir.exists():
+            shutil.rmtree(view_dir)
+        os.replace(tmp_dir, view_dir)
+        (self.store_dir / "current").write_text(version + "\n")
+        self.log(f"版本视图已发布: {Colors.VALUE}{version}{Colors.RESET} ({len(files)} 个文件)", "SUCCESS", "✓")
+    
+    def prune_store(self):
+        """保留最近 keep_versions 个版本视图，删除不再被任何视图或输出目录引用的内容"""
+        views_dir = self.store_dir / "views"
+        if not views_dir.is_dir():
+            return
+        try:
+            current = (self.store_dir / "current").read_text().strip()
+        except OSError:
+            current = None
+        
+        views = []
+        for view_dir in views_dir.iterdir():
+            view = self.read_view(view_dir) if view_dir.is_dir() else None
+            if view is not None:
+                views.append(((view.get("created", ""), view.get("timestamp", 0)), view_dir, view))
+        views.sort(key=lambda item: item[0], reverse=True)
+        
+        referenced = set()
+        for index, (_, view_dir, view) in enumerate(views):
+            if index < self.keep_versions or view_dir.name == current:
+                referenced.update(view["files"].values())
+            else:
+                shutil.rmtree(view_dir)
+                self.log(f"已删除旧版本视图: {Colors.VALUE}{view_dir.name}{Colors.RESET}", "DEBUG", "🗑️ ")
+        for file in self.output_dir.iterdir():
+            if file.is_file() and file.name in self.load_digest_index():
+                referenced.add(self.get_file_digest(file))
+        
+        freed = 0
+        for blob in (self.store_dir / "blobs" / "sha256").glob("*/*"):
+            if blob.name not in referenced:
+                freed += blob.stat().st_size
+                blob.unlink()
+        if freed:
+            self.log(f"存储清理释放空间: {Colors.VALUE}{freed / (1024 * 1024):.2f} MB{Colors.RESET}", "DEBUG", "🗑️ ")
+    
+    def find_view(self, version):
+        """按视图标识查找版本视图；给出 Docker 版本号时选择该版本最新创建的视图"""
+        views_dir = self.store_dir / "views"
+        view_dir = views_dir / version
+        if not version.startswith(".") and "/" not in version and self.read_view(view_dir) is not None:
+            return view_dir
+        candidates = []
+        for path in views_dir.glob("*"):
+            view = self.read_view(path) if path.is_dir() and not path.name.startswith(".") else None
+            if view is not None and view.get("docker_version") == version:
+                candidates.append((view.get("created", ""), view.get("timestamp", 0), path))
+        return max(candidates)[-1] if candidates else None
+    
+    def rollback(self, version):
+        """切换输出目录到已存储的版本视图，仅重建硬链接，不下载任何文件"""
+        view_dir = self.find_view(version)
+        if view_dir is None:
+            available = sorted(p.name for p in (self.store_dir / "views").glob("*") if self.read_view(p))
+            self.log(f"版本视图不存在: {Colors.KEY}{version}{Colors.RESET}，可用视图: {Colors.VALUE}{', '.join(available) or '无'}{Colors.RESET}", "ERROR", "✗")
+            return False
+        view = self.read_view(view_dir)
+        version = view_dir.name
+        
+        artifact_re = re.compile(r'^docker-(rootless-extras-|compose-linux-)?\d+\.\d+\.\d+-')
+        for file in self.output_dir.iterdir():
+            if file.is_file() and artifact_re.match(file.name) and file.name not in view["files"]:
+                file.unlink()
+        for name, digest in view["files"].items():
+            blob = self.store_blob_path(digest)
+            if not blob.exists():
+                self.log(f"存储中缺少文件内容: {Colors.KEY}{name}{Colors.RESET}", "ERROR", "✗")
+                return False
+            self.link_or_copy(blob, self.output_dir / name)
+            self.record_digest(self.output_dir / name, digest)
+        for meta in ("SHA256SUMS", "VERSION.json"):
+            if (view_dir / meta).exists():
+                shutil.copy2(view_dir / meta, self.output_dir / meta)
+        self.save_digest_index()
+        (self.store_dir / "current").write_text(version + "\n")
+        self.log(f"已切换到版本视图 {Colors.VALUE}{version}{Colors.RESET} (Docker {Colors.VALUE}{view['docker_version']}{Colors.RESET}, "
+                 f"Compose {Colors.VALUE}{view['compose_version']}{Colors.RESET})", "NOTICE", "✓")
+        return True
+    
+    def artifact_version_pattern(self, kind, arch):
+        patterns = {
+            "docker": rf"docker-(\d+\.\d+\.\d+)-{arch}\.tgz",
+            "rootless": rf"docker-rootless-extras-(\d+\.\d+\.\d+)-{arch}\.tgz",
+            "compose": rf"docker-compose-linux-(\d+\.\d+\.\d+)-{arch}",
+        }
+        return re.compile(patterns[kind])
+    
+    def delta_sources(self, artifact):
+        """返回可作为差量基准的旧版本文件 [(版本, 文件名, 路径)]，新版本在前
+        
+        输出目录中尚未清理的旧版本之外，启用存储时还包括各版本视图中保留的文件。
+        """
+        pattern = self.artifact_version_pattern(artifact["kind"], artifact["arch"])
+        sources = {}
+        for file in self.output_dir.iterdir():
+            match = pattern.fullmatch(file.name)
+            if match and file.is_file():
+                sources[match.group(1)] = (file.name, file)
+        views_dir = self.store_dir / "views"
+        if self.store and views_dir.is_dir():
+            for view_dir in views_dir.iterdir():
+                view = self.read_view(view_dir) if view_dir.is_dir() else None
+                for name, digest in (view or {}).get("files", {}).items():
+                    match = pattern.fullmatch(name)
+                    if match and match.group(1) not in sources and self.store_blob_path(digest).exists():
+                        sources[match.group(1)] = (name, self.store_blob_path(digest))
+        
+        current = tuple(int(part) for part in artifact["version"].split("."))
+        versions = sorted(
+            (version for version in sources if tuple(int(part) for part in version.split(".")) < current),
+            key=lambda version: tuple(int(part) for part in version.split(".")),
+            reverse=True,
+        )
+        return [(version,) + sources[version] for version in versions[:self.keep_versions]]
+    
+    def create_delta(self, source_name, source_path, target_path, delta_path):
+        """生成一个差量补丁，并在发布前实际应用一次确认能逐字节重建目标文件"""
+        data = BinaryDelta().create(source_path, target_path)
+        target_digest = self.get_file_digest(target_path)
+        if len(data) > target_path.stat().st_size * self.delta_max_ratio:
+            return len(data), False
+        
+        tmp_file = delta_path.with_name(f".{delta_path.name}.{os.getpid()}.tmp")
+        with open(tmp_file, "wb") as f:
+            f.write(data)
+        try:
+            with open(os.devnull, "wb") as sink:
+                rebuilt = BinaryDelta.apply(tmp_file, source_path, sink)
+        except (DeltaError, OSError, subprocess.CalledProcessError) as e:
+            self.log(f"  → 差量补丁自检失败 {delta_path.name}: {e}", "WARNING", "⚠️")
+            rebuilt = None
+        if rebuilt != target_digest:
+            tmp_file.unlink()
+            return len(data), False
+        os.replace(tmp_file, delta_path)
+        return len(data), True
+    
+    def build_deltas(self, plan):
+        """为本次计划中的每个文件生成相对旧版本的差量补丁，写入 deltas/ 并生成 deltas/SHA256SUMS"""
+        self.deltas_dir.mkdir(exist_ok=True)
+        jobs = []
+        wanted = set()
+        targets = {}
+        for artifact in plan["artifacts"]:
+            target = self.output_dir / artifact["filename"]
+            if not target.is_file():
+                continue
+            target_digest = self.get_file_digest(target)
+            targets[target.name] = target_digest
+            for version, source_name, source_path in self.delta_sources(artifact):
+                delta_path = self.deltas_dir / f"{target.name}.from-{version}.delta"
+                wanted.add(delta_path.name)
+                try:
+                    header = BinaryDelta.read_header(delta_path) if delta_path.exists() else None
+                except (DeltaError, OSError, struct.error):
+                    header = None
+                if header and header["target"]["sha256"] == target_digest:
+                    continue
+                jobs.append((source_name, source_path, target, delta_path))
+        
+        # 压缩与哈希在 C 层释放 GIL，多个补丁可以并行生成
+        with ThreadPoolExecutor(max_workers=min(self.hash_jobs, max(1, len(jobs)))) as pool:
+            futures = [(job, pool.submit(self.create_delta, *job)) for job in jobs]
+            for (source_name, _, target, delta_path), future in futures:
+                try:
+                    size, published = future.result()
+                except (OSError, MemoryError, subprocess.CalledProcessError) as e:
+                    self.log(f"生成差量补丁失败 {delta_path.name}: {e}", "ERROR", "✗")
+                    continue
+                ratio = size / max(1, target.stat().st_size)
+                if published:
+                    self.log(f"差量补丁: {Colors.VALUE}{source_name}{Colors.RESET} → {Colors.VALUE}{target.name}{Colors.RESET} "
+                             f"{Colors.VALUE}{size / (1024 * 1024):.2f} MB{Colors.RESET} ({ratio:.1%})", "SUCCESS", "✓")
+                else:
+                    self.log(f"差量补丁收益不足，未发布: {delta_path.name} ({ratio:.1%})", "INFO", "⊘")
+        
+        for file in self.deltas_dir.glob("*.delta"):
+            if file.name in wanted:
+                continue
+            # 未启用存储时旧版本文件在上一轮结束时已被清理，目标仍是当前文件的补丁继续保留
+            try:
+                target = BinaryDelta.read_header(file)["target"]
+            except (DeltaError, OSError, KeyError, TypeError, struct.error):
+                target = None
+            if not target or targets.get(target.get("name")) != target.get("sha256"):
+                file.unlink()
+                self.log(f"已删除过期差量补丁: {Colors.VALUE}{file.name}{Colors.RESET}", "DEBUG", "🗑️ ")
+        deltas = sorted(self.deltas_dir.glob("*.delta"))
+        checksums = "".join(f"{self.calculate_file_hash(file)}  {file.name}\n" for file in deltas)
+        self.write_atomic(self.deltas_dir / "SHA256SUMS", checksums)
+        total = sum(file.stat().st_size for file in deltas)
+        self.log(f"差量补丁: {Colors.VALUE}{len(deltas)}{Colors.RESET} 个，共 {Colors.VALUE}{total / (1024 * 1024):.2f} MB{Colors.RESET}", "INFO", "📦")
+    
+    def apply_deltas(self, delta_paths, checksums_file=None):
+        """在输出目录中应用差量补丁，重建的文件必须同时匹配补丁记录与 SHA256SUMS 中的摘要"""
+        checksums_file = Path(checksums_file) if checksums_file else self.output_dir / "SHA256SUMS"
+        try:
+            expected = self.read_checksums(checksums_file)
+        except OSError:
+            self.log(f"无法读取校验和文件: {Colors.KEY}{checksums_file}{Colors.RESET}", "ERROR", "✗")
+            return False
+        
+        success = True
+        for delta_path in map(Path, delta_paths):
+            try:
+                header = BinaryDelta.read_header(delta_path)
+                source_path = self.output_dir / header["source"]["name"]
+                target_path = self.output_dir / header["target"]["name"]
+                if expected.get(target_path.name) != header["target"]["sha256"]:
+                    raise DeltaError(f"SHA256SUMS 中没有 {target_path.name} 或摘要不一致")
+                if not source_path.is_file():
+                    raise DeltaError(f"缺少源文件 {source_path.name}")
+                
+                tmp_file = target_path.with_name(f".{target_path.name}.{os.getpid()}.tmp")
+                try:
+                    with open(tmp_file, "wb") as f:
+                        digest = BinaryDelta.apply(delta_path, source_path, f)
+                    if digest != expected[target_path.name]:
+                        raise DeltaError(f"重建的 {target_path.name} 摘要不一致")
+                    os.chmod(tmp_file, int(header["target"].get("mode", "0644"), 8))
+                    os.replace(tmp_file, target_path)
+                finally:
+                    if tmp_file.exists():
+                        tmp_file.unlink()
+            except (DeltaError, OSError, KeyError, struct.error) as e:
+                self.log(f"应用差量补丁失败 {Colors.KEY}{delta_path.name}{Colors.RESET}: {e}", "ERROR", "✗")
+                success = False
+                continue
+            self.record_digest(target_path, digest)
+            self.log(f"已重建并校验: {Colors.VALUE}{target_path.name}{Colors.RESET}", "SUCCESS", "✓")
+        self.save_digest_index()
+        return success
+    
     def cleanup_logs(self, keep_count=3):
         try:
             logs = sorted(self.output_dir.glob("update_log_*.txt"), key=lambda x: x.stat().st_mtime, reverse=True)
@@ -376,7 +2551,7 @@ class DockerUpdater:
         except Exception as e:
             self.log(f"清理日志时出错: {e}", "ERROR", "✗")
     
-    def create_version_info(self, docker_version, compose_version):
+    def create_version_info(self, docker_version, compose_version, channels=None):
         """创建版本信息文件"""
         version_info = {
             "docker_version": docker_version,
@@ -385,78 +2560,458 @@ class DockerUpdater:
             "architectures": self.architectures,
             "download_stats": self.download_stats
         }
+        if channels:
+            version_info["channels"] = {
+                name: {key: channel[key] for key in ("docker_version", "compose_version", "architectures")}
+                for name, channel in channels.items()
+            }
         
         version_file = self.output_dir / "VERSION.json"
-        with open(version_file, "w", encoding="utf-8") as f:
-            json.dump(version_info, f, indent=2, ensure_ascii=False)
+        
+        # 增量同步且没有任何文件变化时保留原版本信息，避免无意义的提交
+        if self.sync and self.download_stats['success'] == 0 and self.download_stats['failed'] == 0:
+            current = self.read_version_info()
+            if (current.get("docker_version") == docker_version
+                    and current.get("compose_version") == compose_version
+                    and current.get("architectures") == self.architectures
+                    and current.get("channels") == version_info.get("channels")):
+                self.log("版本信息未变化，保留现有 VERSION.json", "INFO", "⊘")
+                return
+        
+        self.save_json(version_file, version_info)
         
         self.log(f"版本信息已保存: {Colors.VALUE}{version_file}{Colors.RESET}", "SUCCESS", "✓")
     
+    def is_checksum_candidate(self, file):
+        # Compose 文件名中的版本号带点，不能按扩展名判断；只匹配完整文件名，排除续传用的 .part 文件
+        if file.name.startswith("docker-compose-linux-"):
+            return file.is_file() and any(self.artifact_version_pattern("compose", arch).fullmatch(file.name)
+                                          for arch in self.arch_mapping)
+        return file.is_file() and file.suffix in ['.tgz', ''] and file.name != 'SHA256SUMS'
+    
     def create_checksums_file(self):
         """创建校验和文件"""
         checksums_file = self.output_dir / "SHA256SUMS"
         
-        with open(checksums_file, 'w') as f:
-            for file in sorted(self.output_dir.glob("*")):
-                if file.is_file() and file.suffix in ['.tgz', ''] and file.name != 'SHA256SUMS':
-                    sha256 = self.calculate_file_hash(file)
-                    f.write(f"{sha256}  {file.name}\n")
+        files = [file for file in sorted(self.output_dir.glob("*")) if self.is_checksum_candidate(file)]
+        # 并行计算摘要，map 保持输入顺序，输出与串行结果逐字节一致
+        if self.hash_jobs > 1 and len(files) > 1:
+            with ThreadPoolExecutor(max_workers=min(self.hash_jobs, len(files))) as pool:
+                digests = list(pool.map(self.get_file_digest, files))
+        else:
+            digests = [self.get_file_digest(file) for file in files]
+        content = "".join(f"{sha256}  {file.name}\n" for file, sha256 in zip(files, digests))
+        unchanged = not self.write_atomic(checksums_file, content)
+        
+        # 移除已不存在文件的摘要记录
+        index = self.load_digest_index()
+        with self._lock:
+            for name in [name for name in index if not (self.output_dir / name).is_file()]:
+                del index[name]
+        self.save_digest_index()
+        if unchanged:
+            self.log(f"校验和文件未变化: {Colors.VALUE}{checksums_file}{Colors.RESET}", "INFO", "⊘")
+        else:
+            self.log(f"校验和文件已创建: {Colors.VALUE}{checksums_file}{Colors.RESET}", "SUCCESS", "✓")
+        
+    def write_atomic(self, path, content):
+        """内容变化时才写入，先写临时文件再重命名；返回是否写入"""
+        path = Path(path)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                if f.read() == content:
+                    return False
+        except OSError:
+            pass
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # 临时文件名包含进程与线程标识，并发写入同一文件时互不覆盖
+        tmp_file = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_file, path)
+        return True
+    
+    def load_json(self, path, default=None):
+        """读取 JSON 文件，文件不存在或内容无效时返回 default"""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return default
+    
+    def save_json(self, path, data, indent=2, **options):
+        """以 JSON 格式原子地写入文件；返回是否写入"""
+        return self.write_atomic(path, json.dumps(data, indent=indent, ensure_ascii=False, **options) + "\n")
+    
+    def save_shared_json(self, path, data, merge, **options):
+        """在 .cache 文件锁内读取磁盘上的最新内容，用 merge(磁盘内容, data) 合并后写入
+        
+        分片模式下多个进程共享同一个 .cache 目录，直接覆盖会丢失其他分片写入的条目。
+        """
+        with FileLock(self.cache_dir / ".lock"):
+            on_disk = self.load_json(path, {})
+            merged = merge(on_disk if isinstance(on_disk, dict) else {}, data)
+            self.save_json(path, merged, **options)
+        return merged
+    
+    def read_checksums(self, path):
+        """解析 SHA256SUMS 格式的文件，返回 {文件名: sha256}；文件无法读取时抛出 OSError"""
+        checksums = {}
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 2:
+                    checksums[parts[1].lstrip('*')] = parts[0]
+        return checksums
+    
+    def write_shard_manifest(self, plan):
+        """分片模式下写入本分片的部分清单（文件摘要、版本与统计），不修改共享的 VERSION.json 与 SHA256SUMS"""
+        files = {}
+        for artifact in plan["artifacts"]:
+            path = self.output_dir / artifact["filename"]
+            if self.is_checksum_candidate(path):
+                files[path.name] = self.get_file_digest(path)
+        self.save_digest_index()
+        
+        shard = {
+            "shard": self.shard,
+            "docker_version": plan["docker_version"],
+            "compose_version": plan["compose_version"],
+            "architectures": self.architectures,
+            "resolved_docker_versions": plan["resolved_docker_versions"],
+            "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "download_stats": self.download_stats,
+            "files": dict(sorted(files.items())),
+        }
+        shard_file = self.shards_dir / f"{self.shard}.json"
+        with FileLock(self.shards_dir / ".lock"):
+            self.write_atomic(shard_file, json.dumps(shard, indent=2, ensure_ascii=False) + "\n")
+        self.log(f"分片清单已写入: {Colors.VALUE}{shard_file}{Colors.RESET} ({len(files)} 个文件)", "SUCCESS", "✓")
+    
+    def merge_shards(self, expected=None):
+        """在文件锁保护下合并所有分片清单，生成确定性的 VERSION.json 与 SHA256SUMS"""
+        with FileLock(self.shards_dir / ".lock"):
+            shards = {}
+            for path in sorted(self.shards_dir.glob("*.json")):
+                if expected and path.stem not in expected:
+                    # 不在 --expect 中的多为以前运行遗留的分片清单，不参与合并
+                    self.log(f"忽略未列入 --expect 的分片清单: {Colors.KEY}{path.name}{Colors.RESET}", "WARNING", "⊘")
+                    continue
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        shards[path.stem] = json.load(f)
+                except (OSError, ValueError) as e:
+                    self.log(f"无法读取分片清单 {path.name}: {e}", "ERROR", "✗")
+                    return False
+            
+            missing = sorted(set(expected or []) - set(shards))
+            if not shards or missing:
+                self.log(f"缺少分片清单: {Colors.KEY}{', '.join(missing) or '全部'}{Colors.RESET}", "ERROR", "✗")
+                return False
+            
+            versions = {(shard["docker_version"], shard["compose_version"]) for shard in shards.values()}
+            if len(versions) > 1:
+                detail = ", ".join(f"{name}={shard['docker_version']}/{shard['compose_version']}" for name, shard in shards.items())
+                self.log(f"分片版本不一致，请重新运行过期的分片: {detail}", "ERROR", "✗")
+                return False
+            docker_version, compose_version = versions.pop()
+            
+            files = {}
+            for name, shard in shards.items():
+                for filename, digest in shard["files"].items():
+                    path = self.output_dir / filename
+                    if files.get(filename, digest) != digest:
+                        self.log(f"分片 {name} 中 {Colors.KEY}{filename}{Colors.RESET} 的摘要与其他分片冲突", "ERROR", "✗")
+                        return False
+                    if not path.is_file() or self.get_file_digest(path) != digest:
+                        self.log(f"分片 {name} 记录的文件缺失或已变化: {Colors.KEY}{filename}{Colors.RESET}", "ERROR", "✗")
+                        return False
+                    files[filename] = digest
+            
+            known = [arch for arch in self.arch_mapping if any(arch in shard["architectures"] for shard in shards.values())]
+            others = sorted({arch for shard in shards.values() for arch in shard["architectures"]} - set(known))
+            stats = {key: sum(shard["download_stats"].get(key, 0) for shard in shards.values())
+                     for key in self.download_stats}
+            version_info = {
+                "docker_version": docker_version,
+                "compose_version": compose_version,
+                "update_date": max(shard["created"] for shard in shards.values()),
+                "architectures": known + others,
+                "download_stats": stats,
+            }
+            checksums = "".join(f"{files[name]}  {name}\n" for name in sorted(files))
+            
+            changed = self.write_atomic(self.output_dir / "SHA256SUMS", checksums)
+            changed |= self.write_atomic(self.output_dir / "VERSION.json", json.dumps(version_info, indent=2, ensure_ascii=False))
+        
+        self.save_digest_index()
+        state = "已更新" if changed else "未变化"
+        self.log(f"已合并 {Colors.VALUE}{len(shards)}{Colors.RESET} 个分片 ({', '.join(shards)}): {Colors.VALUE}{len(files)}{Colors.RESET} 个文件，VERSION.json 与 SHA256SUMS {state}", "SUCCESS", "✓")
+        self.set_output('docker_version', docker_version)
+        self.set_output('compose_version', compose_version)
+        return True
+    
+    def resolve_rootless_version(self, arch, docker_version):
+        """解析 Rootless Extras 版本，目标版本不存在时回退到最新可用版本"""
+        docker_arch = self.arch_mapping[arch]['docker_arch']
+        rootless_url = self.rootless_url_template.format(arch=docker_arch, version=docker_version)
+        if self.check_url_exists(rootless_url):
+            return docker_version
+        avail_rootless = self.list_rootless_versions(docker_arch)
+        if not avail_rootless:
+            return docker_version
+        fallback = avail_rootless[0]
+        self.log(f"Rootless Extras 版本 {Colors.KEY}{docker_version}{Colors.RESET} 不存在，{Colors.VALUE}{self.arch_mapping[arch]['display_name']}{Colors.RESET} 回退到 {Colors.VALUE}{fallback}{Colors.RESET}", "WARNING", "⊘")
+        return fallback
+    
+    def plan_architecture(self, arch, docker_version, compose_version, pool):
+        """并发解析特定架构的所有下载项，返回 (解析后的 Docker 版本, 下载项列表)"""
+        arch_info = self.arch_mapping[arch]
+        docker_future = pool.submit(self.resolve_static_version_for_arch, arch_info['docker_arch'], docker_version)
+        compose_future = pool.submit(self.get_compose_asset_url, compose_version, arch_info['compose_arch'])
+        resolved_version = docker_future.result()
+        rootless_version = self.resolve_rootless_version(arch, resolved_version)
+        
+        artifacts = [
+            {
+                "arch": arch,
+                "kind": "docker",
+                "version": resolved_version,
+                "filename": f"docker-{resolved_version}-{arch}.tgz",
+                "url": self.docker_url_template.format(arch=arch_info['docker_arch'], version=resolved_version),
+                "mirrors": self.mirror_urls("docker", arch_info['docker_arch'], resolved_version),
+                "description": f"Docker 二进制包 ({arch})",
+                "mode": None,
+            },
+            {
+                "arch": arch,
+                "kind": "compose",
+                "version": compose_version,
+                "filename": f"docker-compose-linux-{compose_version}-{arch}",
+                "url": compose_future.result(),
+                "mirrors": self.mirror_urls("compose", arch_info['compose_arch'], compose_version),
+                "description": f"Docker Compose ({arch})",
+                "mode": "0755",
+            },
+            {
+                "arch": arch,
+                "kind": "rootless",
+                "version": rootless_version,
+                "filename": f"docker-rootless-extras-{rootless_version}-{arch}.tgz",
+                "url": self.rootless_url_template.format(arch=arch_info['docker_arch'], version=rootless_version),
+                "mirrors": self.mirror_urls("rootless", arch_info['docker_arch'], rootless_version),
+                "description": f"Docker Rootless Extras ({arch})" if rootless_version == resolved_version
+                               else f"Docker Rootless Extras (fallback {arch})",
+                "mode": None,
+            },
+        ]
+        return resolved_version, artifacts
+    
+    def resolve_channel_docker(self, arch, spec, latest):
+        """按通道规则解析某架构的 Docker 版本：latest、28.x / 28.1.x 系列中的最新版本或固定版本"""
+        if spec == "latest":
+            return self.resolve_static_version_for_arch(arch, latest)
+        versions = self.list_static_versions(arch)
+        if spec.endswith(".x"):
+            return next((version for version in versions if version.startswith(spec[:-1])), None)
+        return spec if spec in versions else None
+    
+    def resolve_channel_compose(self, spec, latest):
+        """按通道规则解析 Compose 版本；系列规则从 GitHub 发布列表中选择最新的正式版本"""
+        if spec == "latest":
+            return latest
+        if not spec.endswith(".x"):
+            return spec
+        try:
+            releases = self.fetch_github_json("/repos/docker/compose/releases?per_page=100")
+        except Exception as e:
+            self.not_found_or_raise("获取 Compose 发布列表失败", e)
+            return None
+        versions = []
+        for release in releases:
+            m = re.fullmatch(r'v?(\d+\.\d+\.\d+)', release.get('tag_name', ''))
+            if m and not release.get('prerelease') and not release.get('draft') and m.group(1).startswith(spec[:-1]):
+                versions.append(m.group(1))
+        return max(versions, key=lambda v: tuple(map(int, v.split('.'))), default=None)
+    
+    def build_channel_plan(self):
+        """解析通道矩阵：各架构的静态索引只解析一次供所有通道共享，所有通道的下载项按文件名去重"""
+        specs = list(self.channels.values())
+        with ThreadPoolExecutor(max_workers=max(4, 2 * len(self.arch_mapping))) as pool:
+            docker_future = pool.submit(self.get_latest_docker_version) if any(c["docker"] == "latest" for c in specs) else None
+            compose_future = pool.submit(self.get_latest_compose_version) if any(c["compose"] == "latest" for c in specs) else None
+            latest_docker = docker_future.result() if docker_future else None
+            latest_compose = compose_future.result() if compose_future else None
+            
+            channels = {}
+            tasks = []
+            for name, spec in self.channels.items():
+                compose_version = self.resolve_channel_compose(spec["compose"], latest_compose)
+                channel = {
+                    "docker": spec["docker"],
+                    "compose": spec["compose"],
+                    "docker_version": None,
+                    "compose_version": compose_version,
+                    "architectures": [],
+                    "resolved_docker_versions": {},
+                    "files": [],
+                    "errors": [],
+                }
+                channels[name] = channel
+                if compose_version is None:
+                    channel["errors"].append(f"Compose {spec['compose']} 无可用版本")
+                    continue
+                for arch in spec["architectures"]:
+                    docker_version = self.resolve_channel_docker(self.arch_mapping[arch]['docker_arch'], spec["docker"], latest_docker)
+                    if docker_version is None:
+                        channel["errors"].append(f"Docker {spec['docker']} ({arch}) 无可用版本")
+                        continue
+                    channel["architectures"].append(arch)
+                    tasks.append((name, arch, docker_version, compose_version))
+            
+            with ThreadPoolExecutor(max_workers=max(1, len(tasks))) as arch_pool:
+                futures = [
+                    arch_pool.submit(self.plan_architecture, arch, docker_version, compose_version, pool)
+                    for _, arch, docker_version, compose_version in tasks
+                ]
+                task_results = [future.result() for future in futures]
+        
+        artifacts = {}
+        for (name, arch, _, _), (resolved, arch_artifacts) in zip(tasks, task_results):
+            channel = channels[name]
+            channel["resolved_docker_versions"][arch] = resolved
+            channel["docker_version"] = channel["docker_version"] or resolved
+            for artifact in arch_artifacts:
+                artifacts.setdefault(artifact["filename"], artifact)
+                channel["files"].append(artifact["filename"])
+        
+        for name, channel in channels.items():
+            for error in channel["errors"]:
+                self.log(f"通道 {Colors.KEY}{name}{Colors.RESET}: {error}", "ERROR", "✗")
+            self.log(f"通道 {Colors.KEY}{name}{Colors.RESET}: Docker {Colors.VALUE}{channel['docker_version']}{Colors.RESET}, "
+                     f"Compose {Colors.VALUE}{channel['compose_version']}{Colors.RESET} ({', '.join(channel['architectures']) or '-'})", "INFO", "📌")
+        self.log(f"通道矩阵共需 {Colors.VALUE}{len(artifacts)}{Colors.RESET} 个文件 "
+                 f"(去重前 {Colors.VALUE}{sum(len(c['files']) for c in channels.values())}{Colors.RESET} 个)", "INFO", "📋")
         
-        self.log(f"校验和文件已创建: {Colors.VALUE}{checksums_file}{Colors.RESET}", "SUCCESS", "✓")
+        # 第一个通道作为主通道，其版本写入 VERSION.json 的顶层字段，与单版本模式保持兼容
+        primary = next(iter(channels.values()))
+        architectures = [arch for arch in self.arch_mapping if any(arch in c["architectures"] for c in channels.values())]
+        return {
+            "docker_version": primary["docker_version"],
+            "compose_version": primary["compose_version"],
+            "architectures": architectures,
+            "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "resolved_docker_versions": primary["resolved_docker_versions"],
+            "channels": channels,
+            "artifacts": list(artifacts.values()),
+        }
+    
+    def write_channel_manifests(self, plan):
+        """为每个通道写入 channels/<名称>.json 与 channels/<名称>.SHA256SUMS（路径相对于输出目录）"""
+        channels_dir = self.output_dir / "channels"
+        channels_dir.mkdir(exist_ok=True)
+        wanted = set()
+        for name, channel in plan["channels"].items():
+            files = {}
+            for filename in channel["files"]:
+                path = self.output_dir / filename
+                if self.is_checksum_candidate(path):
+                    files[filename] = self.get_file_digest(path)
+            manifest = {
+                "channel": name,
+                "docker": channel["docker"],
+                "compose": channel["compose"],
+                "docker_version": channel["docker_version"],
+                "compose_version": channel["compose_version"],
+                "architectures": channel["architectures"],
+                "resolved_docker_versions": channel["resolved_docker_versions"],
+                "files": dict(sorted(files.items())),
+            }
+            self.write_atomic(channels_dir / f"{name}.json", json.dumps(manifest, indent=2, ensure_ascii=False) + "\n")
+            self.write_atomic(channels_dir / f"{name}.SHA256SUMS",
+                              "".join(f"{digest}  {filename}\n" for filename, digest in sorted(files.items())))
+            wanted.update((f"{name}.json", f"{name}.SHA256SUMS"))
+        for file in channels_dir.iterdir():
+            if file.name not in wanted and not file.name.startswith("."):
+                file.unlink()
+        self.log(f"通道清单已写入: {Colors.VALUE}{', '.join(plan['channels'])}{Colors.RESET}", "SUCCESS", "✓")
+    
+    def build_plan(self):
+        """解析所有版本、下载地址与目标文件名，生成可序列化的下载计划"""
+        if self.channels:
+            return self.build_channel_plan()
+        with ThreadPoolExecutor(max_workers=max(4, 2 * len(self.architectures))) as pool:
+            docker_future = pool.submit(self.get_latest_docker_version)
+            compose_future = pool.submit(self.get_latest_compose_version)
+            docker_version = docker_future.result()
+            compose_version = compose_future.result()
+            
+            with ThreadPoolExecutor(max_workers=len(self.architectures)) as arch_pool:
+                arch_futures = [
+                    arch_pool.submit(self.plan_architecture, arch, docker_version, compose_version, pool)
+                    for arch in self.architectures
+                ]
+                arch_results = [future.result() for future in arch_futures]
         
-    def download_for_architecture(self, arch, docker_version, compose_version):
-        """为特定架构下载所有组件"""
+        return {
+            "docker_version": docker_version,
+            "compose_version": compose_version,
+            "architectures": list(self.architectures),
+            "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "resolved_docker_versions": {
+                arch: resolved for arch, (resolved, _) in zip(self.architectures, arch_results)
+            },
+            "artifacts": [artifact for _, artifacts in arch_results for artifact in artifacts],
+        }
+    
+    def artifact_priority(self, artifact):
+        """Compose 单文件较小，优先于大体积 tar 包获得连接"""
+        if artifact["kind"] == "compose":
+            return TransferScheduler.PRIORITY_SMALL
+        return TransferScheduler.PRIORITY_BULK
+    
+    def download_artifact(self, artifact):
+        """执行计划中的单个下载项"""
+        self.transfer_metric(artifact["filename"]).update(
+            arch=artifact["arch"], kind=artifact["kind"], version=artifact["version"])
+        if not artifact.get("url"):
+            self.log(f"{artifact['description']} 未找到下载地址", "ERROR", "✗")
+            self.record_stat('failed')
+            self.transfer_metric(artifact["filename"])["status"] = "failed"
+            return False
+        filepath = self.output_dir / artifact["filename"]
+        if artifact.get("mirrors") and (self.sync or not filepath.exists()):
+            if self.sync and filepath.exists() and self.verify_existing_file(filepath):
+                source = artifact["url"]
+            elif self.canonical_digest(artifact) is None:
+                # 没有可信摘要就无法证明镜像内容与官方一致，只使用官方源
+                self.log(f"  → {artifact['filename']} 没有可信摘要，跳过镜像直接使用官方源", "DEBUG", "")
+                source = artifact["url"]
+            else:
+                source = self.select_source(artifact)
+            if source != artifact["url"]:
+                if self.download_from_mirror(artifact, source):
+                    if artifact.get("mode"):
+                        os.chmod(filepath, int(artifact["mode"], 8))
+                    return True
+                self.log(f"改用官方源下载 {artifact['description']}", "WARNING", "🔄")
+        if not self.download_file(artifact["url"], artifact["filename"], artifact["description"],
+                                  priority=self.artifact_priority(artifact)):
+            return False
+        if artifact.get("mode"):
+            os.chmod(self.output_dir / artifact["filename"], int(artifact["mode"], 8))
+        return True
+    
+    def log_architecture_header(self, arch):
         arch_info = self.arch_mapping[arch]
         self.log("", "NOTICE", "")  # 空行
         self.log("=" * 60, "NOTICE", "")
         self.log(f"开始下载 {Colors.VALUE}{arch_info['display_name']}{Colors.RESET} 架构文件", "NOTICE", "📦")
         self.log("=" * 60, "NOTICE", "")
         self.log("", "NOTICE", "")  # 空行
-        
-        results = []
-        
-        # 下载 Docker 二进制包
-        docker_filename = f"docker-{docker_version}-{arch}.tgz"
-        docker_url = self.docker_url_template.format(
-            arch=arch_info['docker_arch'],
-            version=docker_version
-        )
-        results.append(self.download_file(docker_url, docker_filename, f"Docker 二进制包 ({arch})"))
-        
-        # 下载 Docker Compose
-        compose_asset_url = self.get_compose_asset_url(compose_version, arch_info['compose_arch'])
-        if compose_asset_url:
-            compose_filename = f"docker-compose-linux-{compose_version}-{arch}"
-            if self.download_file(compose_asset_url, compose_filename, f"Docker Compose ({arch})"):
-                os.chmod(self.output_dir / compose_filename, 0o755)
-                results.append(True)
-            else:
-                results.append(False)
-        else:
-            results.append(False)
-        
-        # 下载 Docker Rootless Extras
-        rootless_filename = f"docker-rootless-extras-{docker_version}-{arch}.tgz"
-        rootless_url = self.rootless_url_template.format(
-            arch=arch_info['docker_arch'],
-            version=docker_version
-        )
-        if self.download_file(rootless_url, rootless_filename, f"Docker Rootless Extras ({arch})"):
-            results.append(True)
-        else:
-            avail_rootless = self.list_rootless_versions(arch_info['docker_arch'])
-            if avail_rootless:
-                fallback = avail_rootless[0]
-                self.log(f"Rootless Extras 版本 {Colors.KEY}{docker_version}{Colors.RESET} 不存在，{Colors.VALUE}{arch_info['display_name']}{Colors.RESET} 回退到 {Colors.VALUE}{fallback}{Colors.RESET}", "WARNING", "⊘")
-                rootless_filename_fb = f"docker-rootless-extras-{fallback}-{arch}.tgz"
-                rootless_url_fb = self.rootless_url_template.format(
-                    arch=arch_info['docker_arch'],
-                    version=fallback
-                )
-                results.append(self.download_file(rootless_url_fb, rootless_filename_fb, f"Docker Rootless Extras (fallback {arch})"))
-            else:
-                results.append(False)
-        
+    
+    def log_architecture_summary(self, arch, results):
+        arch_info = self.arch_mapping[arch]
         success_count = sum(results)
         total_count = len(results)
         
@@ -467,42 +3022,362 @@ class DockerUpdater:
         
         return success_count, total_count
     
-    def update(self):
-        """执行更新流程"""
+    def execute_plan(self, plan):
+        """按计划下载所有文件，返回 {arch: (success, count)}"""
+        artifacts_by_arch = {}
+        for artifact in plan["artifacts"]:
+            artifacts_by_arch.setdefault(artifact["arch"], []).append(artifact)
+        
+        if self.jobs == 1:
+            summary = {}
+            for arch, artifacts in artifacts_by_arch.items():
+                self.log_architecture_header(arch)
+                results = [self.download_artifact(artifact) for artifact in artifacts]
+                summary[arch] = self.log_architecture_summary(arch, results)
+            return summary
+        
+        self.log("", "NOTICE", "")
+        self.log("=" * 60, "NOTICE", "")
+        self.log(f"并发下载所有架构文件 (并发数: {Colors.VALUE}{self.jobs}{Colors.RESET})", "NOTICE", "📦")
+        self.log("=" * 60, "NOTICE", "")
+        
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            # 按优先级提交，小文件不会排在大体积 tar 包之后
+            futures = {
+                id(artifact): pool.submit(self.download_artifact, artifact)
+                for artifact in sorted(plan["artifacts"], key=self.artifact_priority)
+            }
+            for arch, artifacts in artifacts_by_arch.items():
+                results[arch] = []
+                for future in (futures[id(artifact)] for artifact in artifacts):
+                    try:
+                        results[arch].append(bool(future.result()))
+                    except Exception as e:
+                        self.log(f"下载任务异常 ({arch}): {e}", "ERROR", "✗")
+                        results[arch].append(False)
+        
+        self.log("", "NOTICE", "")
+        return {arch: self.log_architecture_summary(arch, arch_results) for arch, arch_results in results.items()}
+    
+    def read_version_info(self):
+        return self.load_json(self.output_dir / "VERSION.json", {})
+    
+    def check_for_updates(self):
+        """使用条件请求查询最新发布版本并与 VERSION.json 比较；上游未变化时只收到 304"""
+        current = self.read_version_info()
+        latest = {}
+        for name, path in (("docker", "/repos/moby/moby/releases/latest"),
+                           ("compose", "/repos/docker/compose/releases/latest")):
+            tag = self.fetch_github_json(path, revalidate=True)['tag_name']
+            m = re.search(r'(\d+\.\d+\.\d+)', tag)
+            if not m:
+                raise ValueError(f"无法解析版本号: {tag}")
+            latest[name] = m.group(1)
+        
+        result = {
+            "current_docker": current.get("docker_version"),
+            "current_compose": current.get("compose_version"),
+            "latest_docker": latest["docker"],
+            "latest_compose": latest["compose"],
+        }
+        result["need_update"] = (
+            result["current_docker"] != result["latest_docker"]
+            or result["current_compose"] != result["latest_compose"]
+            or not set(self.architectures) <= set(current.get("architectures", []))
+        )
+        
+        # 通道模式：逐个通道解析版本规则，与 VERSION.json 中记录的通道版本比较
+        if self.channels:
+            recorded = current.get("channels") or {}
+            result["channels"] = {}
+            for name, spec in self.channels.items():
+                compose_version = self.resolve_channel_compose(spec["compose"], latest["compose"])
+                docker_versions = [self.resolve_channel_docker(self.arch_mapping[arch]['docker_arch'], spec["docker"], latest["docker"])
+                                   for arch in spec["architectures"]]
+                channel = {
+                    "docker_version": next((version for version in docker_versions if version), None),
+                    "compose_version": compose_version,
+                    "architectures": [arch for arch, version in zip(spec["architectures"], docker_versions) if version],
+                }
+                result["channels"][name] = channel
+            result["need_update"] = result["channels"] != recorded
+        return result
+    
+    def write_status(self, **fields):
+        """更新状态并原子地写入状态文件"""
+        with self._lock:
+            self.status.update(fields)
+            self.status["updated"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            content = json.dumps(self.status, indent=2, ensure_ascii=False)
+        try:
+            self.write_atomic(self.status_file, content + "\n")
+        except OSError as e:
+            self.log(f"写入状态文件失败: {e}", "WARNING", "⚠️")
+    
+    def start_status_server(self, port, host="127.0.0.1"):
+        """在后台线程提供只读的 JSON 状态端点（GET /status）"""
+        updater = self
+        
+        class StatusHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/status"):
+                    self.send_error(404)
+                    return
+                with updater._lock:
+                    body = json.dumps(updater.status, ensure_ascii=False).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, *args):
+                pass
+        
+        server = http.server.ThreadingHTTPServer((host, port), StatusHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="status-server", daemon=True).start()
+        self.log(f"状态端点: {Colors.VALUE}http://{host}:{server.server_address[1]}/status{Colors.RESET}", "INFO", "🌐")
+        return server
+    
+    def start_package_server(self, host="0.0.0.0", port=8080, workers=64):
+        """在局域网发布输出目录，供离线节点的 install.sh 拉取并校验"""
+        server = PackageHTTPServer((host, port), PackageRequestHandler, self, workers)
+        self.log(f"发布目录: {Colors.VALUE}{self.output_dir.absolute()}{Colors.RESET}", "INFO", "📦")
+        self.log(f"下载地址: {Colors.VALUE}http://{host}:{server.server_address[1]}/{Colors.RESET} (工作线程 {workers})", "NOTICE", "🌐")
+        return server
+    
+    def reset_run_state(self):
+        """清空上一轮的内存缓存与统计，监视模式下每轮开始前调用"""
+        with self._lock:
+            self._metadata_memo.clear()
+            self._url_exists_memo.clear()
+            self._resolved_versions.clear()
+            self._static_versions.clear()
+            self._canonical_digests.clear()
+            self.recorded_checksums = None
+            self.download_stats = {key: 0 for key in self.download_stats}
+            self.transfer_metrics = {}
+            self.phase_timings = {}
+    
+    def watch(self, interval=3600, jitter=0.1):
+        """持续轮询上游发布版本，检测到变化时执行增量更新"""
+        self.sync = True
+        errors = 0
+        self.write_status(state="starting", pid=os.getpid(), interval=interval, checks=0, updates=0, errors=0)
+        self.log(f"进入监视模式，轮询间隔 {Colors.VALUE}{interval}{Colors.RESET} 秒", "NOTICE", "👀")
+        
+        while True:
+            self.reset_run_state()
+            self.write_status(state="checking", last_check=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            try:
+                result = self.check_for_updates()
+                self.save_metadata_cache()
+                errors = 0
+                self.write_status(checks=self.status["checks"] + 1, last_error=None, **result)
+                
+                if result["need_update"]:
+                    self.log(f"检测到新版本: Docker {Colors.VALUE}{result['latest_docker']}{Colors.RESET}, Compose {Colors.VALUE}{result['latest_compose']}{Colors.RESET}", "NOTICE", "🔔")
+                    self.write_status(state="updating")
+                    # 版本信息已在本轮检查中获取，更新流程直接复用，不会重复请求
+                    success = self.update()
+                    self.write_status(
+                        updates=self.status["updates"] + 1,
+                        last_update={
+                            "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                            "success": success,
+                            "docker_version": result["latest_docker"],
+                            "compose_version": result["latest_compose"],
+                            "download_stats": dict(self.download_stats),
+                        },
+                    )
+                    if success:
+                        self.write_status(need_update=False, current_docker=result["latest_docker"],
+                                          current_compose=result["latest_compose"])
+                    else:
+                        errors += 1
+                else:
+                    self.log("上游版本未变化", "DEBUG", "⊘")
+            except Exception as e:
+                errors += 1
+                self.log(f"检查更新失败: {e}", "ERROR", "✗")
+                self.write_status(errors=self.status["errors"] + 1, last_error=str(e))
+            
+            # 连续失败时缩短重试间隔（指数退避，不超过正常间隔）；加入随机抖动避免多实例同时请求
+            delay = min(interval, 60 * 2 ** (errors - 1)) if errors else interval
+            delay *= random.uniform(1 - jitter, 1 + jitter)
+            self.write_status(state="idle", next_check=datetime.fromtimestamp(time.time() + delay).strftime("%Y-%m-%d %H:%M:%S"))
+            time.sleep(delay)
+    
+    @contextlib.contextmanager
+    def phase(self, name):
+        """记录更新流程中某个阶段的耗时"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phase_timings[name] = self.phase_timings.get(name, 0.0) + time.monotonic() - started
+    
+    def format_prometheus_metrics(self, report):
+        """将指标报告转换为 Prometheus 文本格式（供 node-exporter textfile collector 读取）"""
+        def escape(value):
+            return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        
+        def labels(**values):
+            pairs = (f'{key}="{escape(value)}"' for key, value in values.items() if value is not None)
+            return "{" + ",".join(pairs) + "}"
+        
+        lines = []
+        
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP docker_offline_{name} {help_text}")
+            lines.append(f"# TYPE docker_offline_{name} {kind}")
+            for sample_labels, value in samples:
+                lines.append(f"docker_offline_{name}{sample_labels} {value}")
+        
+        metric("last_run_timestamp_seconds", "gauge", "Unix time of the last update run.",
+               [("", int(report["timestamp"]))])
+        metric("last_run_success", "gauge", "Whether all planned artifacts were downloaded.",
+               [("", int(report["success"]))])
+        metric("phase_duration_seconds", "gauge", "Duration of each update phase.",
+               [(labels(phase=name), round(value, 6)) for name, value in sorted(report["phases"].items())])
+        metric("artifacts", "gauge", "Artifacts by download result.",
+               [(labels(result=key), value) for key, value in sorted(report["download_stats"].items()) if key != "total_size"])
+        
+        transfers = sorted(report["transfers"].items())
+        fields = [
+            ("transfer_duration_seconds", "duration_seconds", "Wall time spent on the artifact, including retries."),
+            ("transfer_bytes", "bytes", "Bytes received from upstream."),
+            ("transfer_throughput_bytes_per_second", "throughput_bytes_per_second", "Average throughput excluding backoff."),
+            ("transfer_retries", "retries", "Retried requests."),
+            ("transfer_backoff_seconds", "backoff_seconds", "Time spent waiting between retries."),
+            ("transfer_hash_seconds", "hash_seconds", "Time spent computing SHA256."),
+            ("transfer_dns_seconds", "dns_seconds", "DNS resolution time of the last new connection."),
+            ("transfer_connect_seconds", "connect_seconds", "TCP connect time of the last new connection."),
+            ("transfer_tls_seconds", "tls_seconds", "TLS handshake time of the last new connection."),
+            ("transfer_ttfb_seconds", "ttfb_seconds", "Time to first response byte of the last request."),
+        ]
+        for name, key, help_text in fields:
+            samples = [
+                (labels(file=filename, arch=data.get("arch"), kind=data.get("kind"), status=data["status"]),
+                 round(data[key], 6) if isinstance(data[key], float) else data[key])
+                for filename, data in transfers if data.get(key) is not None
+            ]
+            if samples:
+                metric(name, "gauge", help_text, samples)
+        return "\n".join(lines) + "\n"
+    
+    def write_metrics(self, plan, success):
+        """写入 JSON 指标报告，并按需写入 Prometheus textfile"""
+        report = {
+            "timestamp": time.time(),
+            "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "success": success,
+            "docker_version": plan["docker_version"],
+            "compose_version": plan["compose_version"],
+            "architectures": plan["architectures"],
+            "phases": {name: round(value, 6) for name, value in self.phase_timings.items()},
+            "download_stats": dict(self.download_stats),
+            "transfers": self.transfer_metrics,
+        }
+        outputs = [(self.metrics_file, json.dumps(report, indent=2, ensure_ascii=False) + "\n")]
+        if self.prometheus_textfile:
+            outputs.append((self.prometheus_textfile, self.format_prometheus_metrics(report)))
+        
+        for path, content in outputs:
+            try:
+                # 先写临时文件再重命名，避免采集端读到写了一半的文件
+                self.write_atomic(path, content)
+            except OSError as e:
+                self.log(f"写入性能指标失败 {path}: {e}", "WARNING", "⚠️")
+        self.log(f"性能指标: {Colors.VALUE}{self.metrics_file}{Colors.RESET}", "DEBUG", "📊")
+    
+    def update(self, plan=None):
+        """执行更新流程；传入 plan 时跳过版本解析，直接执行该下载计划"""
+        run_started = time.monotonic()
+        if plan is not None:
+            self.architectures = plan["architectures"]
+        
         self.log("", "NOTICE", "")
         self.log("=" * 60, "NOTICE", "")
         self.log("开始 Docker 离线安装包更新流程", "NOTICE", "🚀")
         self.log(f"支持架构: {Colors.VALUE}{', '.join([self.arch_mapping[a]['display_name'] for a in self.architectures])}{Colors.RESET}", "INFO", "")
         self.log("=" * 60, "NOTICE", "")
         
-        # 获取最新版本号
-        docker_version = self.get_latest_docker_version()
-        compose_version = self.get_latest_compose_version()
+        # 规划阶段：并发解析所有版本与下载地址
+        if plan is None:
+            with self.phase("resolve"):
+                plan = self.build_plan()
+        docker_version = plan["docker_version"]
+        compose_version = plan["compose_version"]
+        self.architectures = plan["architectures"]
+        self.set_output('docker_version', docker_version)
+        self.set_output('compose_version', compose_version)
         
         self.log("", "NOTICE", "")
         
         total_success = 0
         total_count = 0
         
-        # 为每个架构解析可用版本并下载文件
-        for arch in self.architectures:
-            resolved_version = self.resolve_static_version_for_arch(self.arch_mapping[arch]['docker_arch'], docker_version)
-            success, count = self.download_for_architecture(arch, resolved_version, compose_version)
-            total_success += success
-            total_count += count
+        # 执行阶段：按计划下载所有文件
+        with self.phase("download"):
+            for success, count in self.execute_plan(plan).values():
+                total_success += success
+                total_count += count
         
-        # 创建校验和文件
-        self.create_checksums_file()
+        # 通道解析失败（例如固定版本不存在）也视为更新未完成
+        if any(channel["errors"] for channel in plan.get("channels", {}).values()):
+            total_count += 1
         
-        # 创建版本信息
-        self.create_version_info(docker_version, compose_version)
+        if self.shard:
+            # 分片模式只写入部分清单，由 merge 子命令统一生成 VERSION.json 与 SHA256SUMS
+            with self.phase("checksums"):
+                self.write_shard_manifest(plan)
+        else:
+            # 创建校验和文件
+            with self.phase("checksums"):
+                self.create_checksums_file()
+            
+            # 创建版本信息与通道清单
+            self.create_version_info(docker_version, compose_version, plan.get("channels"))
+            if plan.get("channels"):
+                self.write_channel_manifests(plan)
+            
+            # 发布版本视图（旧版本内容保留在存储中，可随时回滚）
+            if self.store:
+                with self.phase("store"):
+                    self.publish_view(plan)
+            
+            # 生成差量补丁（须在清理旧版本之前，旧版本文件是补丁的基准）
+            if self.deltas:
+                with self.phase("deltas"):
+                    self.build_deltas(plan)
         
         # 清理旧版本文件与日志
-        for arch in self.architectures:
-            resolved_docker_version = self.resolve_static_version_for_arch(self.arch_mapping[arch]['docker_arch'], docker_version)
-            self.cleanup_old_versions(resolved_docker_version, compose_version, arch)
+        with self.phase("cleanup"):
+            keep_files = {artifact["filename"] for artifact in plan["artifacts"]}
+            for arch in self.architectures:
+                self.cleanup_old_versions(keep_files, arch)
             
-        self.cleanup_logs(keep_count=3)
+            # 分片并发运行时不清理共享的存储与日志，避免删除其他分片正在使用的文件
+            if not self.shard:
+                # 旧版本删除后重新生成校验和，SHA256SUMS 只列出实际存在的文件（分发服务按它提供索引）
+                self.create_checksums_file()
+                
+                if self.store:
+                    self.prune_store()
+                    self.save_digest_index()
+                
+                self.cleanup_logs(keep_count=3)
+        self.save_metadata_cache()
+        self.save_mirror_stats()
+        self.session.close()
+        
+        # 输出性能指标
+        self.phase_timings["total"] = time.monotonic() - run_started
+        self.write_metrics(plan, total_success == total_count)
         
         # 总结
         self.log("", "NOTICE", "")
@@ -527,6 +3402,47 @@ class DockerUpdater:
         return total_success == total_count
 
 
+def parse_rate(value):
+    """解析带宽参数，如 500K、20M、1.5G（单位：字节/秒）"""
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)([KMG]?)B?', value.strip().upper())
+    if not match:
+        raise argparse.ArgumentTypeError(f"无效的带宽: {value}")
+    rate = float(match.group(1)) * 1024 ** " KMG".index(match.group(2) or " ")
+    if rate <= 0:
+        raise argparse.ArgumentTypeError(f"带宽必须大于 0: {value}")
+    return rate
+
+
+def load_channels(path, default_architectures):
+    """读取通道矩阵 JSON 文件，格式:
+    {"channels": {"latest": {"docker": "latest", "compose": "latest", "architectures": ["x86_64", "aarch64"]},
+                  "28": {"docker": "28.x", "compose": "2.29.7"}}}
+    版本规则: latest、系列 (28.x / 28.1.x) 或固定版本 (27.5.1)；architectures 省略时使用 -a 指定的架构
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    channels = data.get("channels") if isinstance(data, dict) else None
+    if not isinstance(channels, dict) or not channels:
+        raise ValueError("缺少 channels 定义")
+    
+    spec_re = re.compile(r'latest|\d+(\.\d+)?\.x|\d+\.\d+\.\d+')
+    result = {}
+    for name, channel in channels.items():
+        if not re.fullmatch(r'[A-Za-z0-9._-]+', name) or name.startswith("."):
+            raise ValueError(f"无效的通道名称: {name}")
+        docker = str(channel.get("docker", "latest"))
+        compose = str(channel.get("compose", "latest"))
+        for spec in (docker, compose):
+            if not spec_re.fullmatch(spec):
+                raise ValueError(f"通道 {name} 的版本规则无效: {spec}")
+        architectures = channel.get("architectures") or default_architectures
+        unknown = set(architectures) - {"x86_64", "aarch64"}
+        if unknown:
+            raise ValueError(f"通道 {name} 包含不支持的架构: {', '.join(sorted(unknown))}")
+        result[name] = {"docker": docker, "compose": compose, "architectures": list(architectures)}
+    return result
+
+
 def main():
     # 检查 Python 版本
     if sys.version_info < (3, 6):
@@ -544,6 +3460,38 @@ def main():
   %(prog)s -a aarch64              # 仅下载 ARM64 架构
   %(prog)s -o ./custom-dir         # 指定输出目录
   %(prog)s --ci                    # CI 模式（GitHub Actions）
+  %(prog)s -j 6                    # 并发下载所有架构的全部文件
+  %(prog)s --segments 4            # 大文件分 4 段并行下载
+  %(prog)s --cache-ttl 0           # 每次都向上游重新验证元数据缓存
+  %(prog)s --dry-run plan.json     # 仅生成下载计划，不下载
+  %(prog)s --plan plan.json        # 执行之前生成的下载计划
+  %(prog)s --sync                  # 增量同步：只重新下载缺失或校验失败的文件
+  %(prog)s --buffer-size 4         # 使用 4 MB 读写缓冲区
+  %(prog)s --hash-jobs 4           # 使用 4 个线程并行生成校验和
+  %(prog)s --store --keep 5        # 使用内容寻址存储并保留最近 5 个版本
+  %(prog)s --rollback 29.1.4       # 回滚到存储中 Docker 29.1.4 最新的版本视图
+  %(prog)s --rollback 29.1.5_5.0.1_1a2b3c4d
+                                   # 按视图标识回滚（.store/views/ 下的目录名，可区分仅 Compose 不同的版本）
+  %(prog)s --mirror docker=https://mirror.example.com/docker-ce/linux/static/stable/{arch}/docker-{version}.tgz
+                                   # 添加 Docker 二进制包镜像源（可重复指定）
+  %(prog)s -j 4 --limit-rate 20M   # 并发下载，总带宽限制为 20 MB/s
+  %(prog)s --prometheus-textfile /var/lib/node_exporter/docker_offline.prom
+                                   # 额外输出 Prometheus 指标文件
+  %(prog)s --check --ci            # 仅检查是否有新版本 (设置 need_update 输出)
+  %(prog)s --watch --interval 1800 --status-port 8080
+                                   # 监视模式，每 30 分钟检查一次并提供状态端点
+  %(prog)s -a x86_64 --shard x86_64  # 分片模式：只处理 x86_64 并写入部分清单
+  %(prog)s merge -o ./packages --expect x86_64 aarch64
+                                   # 合并分片清单，生成 VERSION.json 与 SHA256SUMS
+  %(prog)s --channels channels.json # 按通道矩阵同时维护多个版本（latest、28.x、固定版本）
+  %(prog)s --retries 5 --max-retry-wait 600
+                                   # 上游请求最多尝试 5 次，最多等待 10 分钟的速率限制重置
+  GITHUB_TOKEN=... %(prog)s        # 使用令牌访问 GitHub API，避免匿名速率限制
+  %(prog)s --store --deltas          # 生成相对已保留旧版本的差量补丁
+  %(prog)s apply-delta -o /opt/packages --checksums SHA256SUMS deltas/*.delta
+                                   # 离线站点：用补丁重建新版本并校验
+  %(prog)s serve -o ./packages --port 8080
+                                   # 在局域网发布输出目录，节点用 PACKAGES_URL=http://主机:8080 install.sh 安装
         """
     )
     parser.add_argument('-o', '--output', 
@@ -557,15 +3505,206 @@ def main():
     parser.add_argument('--ci', 
                         action='store_true',
                         help='CI 模式（优化日志输出）')
+    parser.add_argument('-j', '--jobs',
+                        type=int,
+                        default=1,
+                        help='并发下载数 (默认: 1，即串行下载)')
+    parser.add_argument('--segments',
+                        type=int,
+                        default=1,
+                        help='大文件分段并行下载的分段数 (默认: 1，即不分段)')
+    parser.add_argument('--segment-threshold',
+                        type=int,
+                        default=16,
+                        help='启用分段下载的最小文件大小，单位 MB (默认: 16)')
+    parser.add_argument('--cache-ttl',
+                        type=int,
+                        default=600,
+                        help='索引页与 GitHub API 元数据缓存有效期，单位秒 (默认: 600)')
+    parser.add_argument('--dry-run',
+                        nargs='?',
+                        const='-',
+                        metavar='FILE',
+                        help='仅解析版本与下载地址，将下载计划以 JSON 写入 FILE (默认输出到 stdout)')
+    parser.add_argument('--plan',
+                        metavar='FILE',
+                        help='执行 --dry-run 生成的下载计划，跳过版本解析')
+    parser.add_argument('--sync',
+                        action='store_true',
+                        help='增量同步：依据现有 SHA256SUMS 校验已有文件，只重新下载缺失、变化或校验失败的文件')
+    parser.add_argument('--buffer-size',
+                        type=float,
+                        default=1,
+                        help='下载与哈希的读写缓冲区大小，单位 MB (默认: 1)')
+    parser.add_argument('--hash-jobs',
+                        type=int,
+                        default=None,
+                        help='生成校验和时的并行哈希线程数 (默认: CPU 核心数)')
+    parser.add_argument('--store',
+                        action='store_true',
+                        help='使用内容寻址存储 (.store/) 保存各版本文件，支持去重与快速回滚')
+    parser.add_argument('--keep',
+                        type=int,
+                        default=3,
+                        help='内容寻址存储保留的版本数 (默认: 3)')
+    parser.add_argument('--rollback',
+                        metavar='VERSION',
+                        help='将输出目录切换到存储中已有的版本视图（视图标识或 Docker 版本号），不下载任何文件')
+    parser.add_argument('--mirror',
+                        action='append',
+                        default=[],
+                        metavar='KIND=TEMPLATE',
+                        help='镜像源 URL 模板，KIND 为 docker、rootless 或 compose，模板支持 {arch} 与 {version} (可重复指定)')
+    parser.add_argument('--mirror-race',
+                        type=int,
+                        default=3,
+                        help='每个文件同时测速的下载源数量 (默认: 3)')
+    parser.add_argument('--max-per-host',
+                        type=int,
+                        default=6,
+                        help='每个上游主机的最大并发连接数 (默认: 6)')
+    parser.add_argument('--limit-rate',
+                        type=parse_rate,
+                        metavar='RATE',
+                        help='全局下载带宽上限，单位字节/秒，支持 K/M/G 后缀 (例如 500K、20M)')
+    parser.add_argument('--metrics-json',
+                        metavar='FILE',
+                        help='性能指标 JSON 报告路径 (默认: <输出目录>/.cache/metrics.json)')
+    parser.add_argument('--prometheus-textfile',
+                        metavar='FILE',
+                        help='同时写入 Prometheus node-exporter textfile 格式的指标文件')
+    parser.add_argument('--retries',
+                        type=int,
+                        default=3,
+                        help='上游请求的最大尝试次数，重试间隔为带随机抖动的指数退避 (默认: 3)')
+    parser.add_argument('--max-retry-wait',
+                        type=float,
+                        default=300,
+                        help='遵循 Retry-After / X-RateLimit-Reset 时允许的最长等待，单位秒，超过则立即失败 (默认: 300)')
+    parser.add_argument('--check',
+                        action='store_true',
+                        help='仅检查上游是否有新版本，不下载 (CI 模式下设置 need_update 等输出)')
+    parser.add_argument('--watch',
+                        action='store_true',
+                        help='监视模式：持续轮询上游版本，有变化时自动执行增量更新')
+    parser.add_argument('--interval',
+                        type=float,
+                        default=3600,
+                        help='监视模式的轮询间隔，单位秒 (默认: 3600，实际间隔带 ±10%% 随机抖动)')
+    parser.add_argument('--status-file',
+                        metavar='FILE',
+                        help='检查/监视状态文件路径 (默认: <输出目录>/.cache/status.json)')
+    parser.add_argument('--status-port',
+                        type=int,
+                        help='监视模式下在 127.0.0.1 的该端口提供 JSON 状态端点')
+    parser.add_argument('--shard',
+                        metavar='NAME',
+                        help='分片模式：只写入 .shards/NAME.json 部分清单，由 merge 子命令生成 VERSION.json 与 SHA256SUMS')
+    parser.add_argument('--channels',
+                        metavar='FILE',
+                        help='通道矩阵 JSON 文件：同时维护多个 Docker/Compose 版本（如 latest、28.x、固定版本），共享解析并去重下载')
+    parser.add_argument('--deltas',
+                        action='store_true',
+                        help='生成相对旧版本的差量补丁到 deltas/ 目录，离线站点用 apply-delta 子命令重建新版本')
+    
+    subparsers = parser.add_subparsers(dest='command', metavar='{merge,apply-delta,serve}')
+    merge_parser = subparsers.add_parser('merge',
+                                         help='合并分片清单',
+                                         description='在文件锁保护下合并 .shards/ 中的分片清单，原子地生成 VERSION.json 与 SHA256SUMS')
+    merge_parser.add_argument('-o', '--output',
+                              default='./packages',
+                              help='输出目录 (默认: ./packages)')
+    merge_parser.add_argument('--expect',
+                              nargs='+',
+                              metavar='SHARD',
+                              help='必须存在的分片名称，缺少任一分片时失败')
+    merge_parser.add_argument('--ci',
+                              action='store_true',
+                              help='CI 模式 (GitHub Actions 输出格式)')
+    apply_parser = subparsers.add_parser('apply-delta',
+                                         help='应用差量补丁',
+                                         description='用目录中的旧版本文件和差量补丁重建新版本文件，并按 SHA256SUMS 校验')
+    apply_parser.add_argument('deltas',
+                              nargs='+',
+                              metavar='DELTA',
+                              help='差量补丁文件')
+    apply_parser.add_argument('-o', '--output',
+                              default='./packages',
+                              help='旧版本文件所在目录，重建的文件也写入该目录 (默认: ./packages)')
+    apply_parser.add_argument('--checksums',
+                              metavar='FILE',
+                              help='新版本的 SHA256SUMS (默认: 输出目录中的 SHA256SUMS)')
+    serve_parser = subparsers.add_parser('serve',
+                                         help='在局域网发布输出目录',
+                                         description='通过 HTTP 发布输出目录（sendfile 零拷贝，支持 Range 与条件请求），/ 返回 VERSION.json 与 SHA256SUMS 索引')
+    serve_parser.add_argument('-o', '--output',
+                              default='./packages',
+                              help='发布的目录 (默认: ./packages)')
+    serve_parser.add_argument('--bind',
+                              default='0.0.0.0',
+                              help='监听地址 (默认: 0.0.0.0)')
+    serve_parser.add_argument('--port',
+                              type=int,
+                              default=8080,
+                              help='监听端口 (默认: 8080)')
+    serve_parser.add_argument('-w', '--workers',
+                              type=int,
+                              default=64,
+                              help='处理连接的工作线程数 (默认: 64)')
     
     args = parser.parse_args()
     
+    # 合并分片清单
+    if args.command == 'merge':
+        updater = DockerUpdater(output_dir=args.output, ci_mode=args.ci or os.getenv('GITHUB_ACTIONS') == 'true')
+        success = updater.merge_shards(args.expect)
+        updater.log_writer.close()
+        sys.exit(0 if success else 1)
+    
+    # 离线站点：应用差量补丁重建新版本文件
+    if args.command == 'apply-delta':
+        updater = DockerUpdater(output_dir=args.output, write_log=False)
+        success = updater.apply_deltas(args.deltas, args.checksums)
+        updater.log_writer.close()
+        sys.exit(0 if success else 1)
+    
+    # 局域网分发服务
+    if args.command == 'serve':
+        updater = DockerUpdater(output_dir=args.output, write_log=False)
+        server = updater.start_package_server(args.bind, args.port, max(1, args.workers))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            updater.log("分发服务已退出", "INFO", "👋")
+        server.server_close()
+        updater.log_writer.close()
+        sys.exit(0)
+    
+    if args.shard and not re.fullmatch(r'[A-Za-z0-9._-]+', args.shard):
+        parser.error(f"无效的分片名称: {args.shard}")
+    if args.shard and args.channels:
+        parser.error("--shard 与 --channels 不能同时使用")
+    
+    mirrors = {}
+    for spec in args.mirror:
+        kind, sep, template = spec.partition('=')
+        if not sep or kind not in ('docker', 'rootless', 'compose'):
+            parser.error(f"无效的镜像源: {spec} (格式: docker|rootless|compose=URL模板)")
+        mirrors.setdefault(kind, []).append(template)
+    
     # 处理架构参数
     if 'all' in args.arch:
         architectures = ['x86_64', 'aarch64']
     else:
         architectures = args.arch
     
+    channels = None
+    if args.channels:
+        try:
+            channels = load_channels(args.channels, architectures)
+        except (OSError, ValueError) as e:
+            parser.error(f"无法读取通道矩阵 {args.channels}: {e}")
+    
     # 检测是否在 GitHub Actions 中运行
     ci_mode = args.ci or os.getenv('GITHUB_ACTIONS') == 'true'
     
@@ -573,11 +3712,103 @@ def main():
     updater = DockerUpdater(
         output_dir=args.output, 
         architectures=architectures,
-        ci_mode=ci_mode
+        ci_mode=ci_mode,
+        jobs=args.jobs,
+        segments=args.segments,
+        segment_threshold=args.segment_threshold * 1024 * 1024,
+        cache_ttl=args.cache_ttl,
+        sync=args.sync,
+        buffer_size=int(args.buffer_size * 1024 * 1024),
+        hash_jobs=args.hash_jobs,
+        store=args.store,
+        keep_versions=args.keep,
+        mirrors=mirrors,
+        mirror_race=args.mirror_race,
+        max_per_host=args.max_per_host,
+        limit_rate=args.limit_rate,
+        metrics_file=args.metrics_json,
+        prometheus_textfile=args.prometheus_textfile,
+        status_file=args.status_file,
+        shard=args.shard,
+        deltas=args.deltas,
+        channels=channels,
+        retries=max(1, args.retries),
+        max_retry_wait=args.max_retry_wait,
+        github_token=os.getenv('GITHUB_TOKEN') or None
     )
     
-    # 执行更新
-    success = updater.update()
+    # 回滚到已存储的版本
+    if args.rollback:
+        success = updater.rollback(args.rollback)
+        updater.log_writer.close()
+        sys.exit(0 if success else 1)
+    
+    # 仅检查是否有新版本
+    if args.check:
+        try:
+            result = updater.check_for_updates()
+        except Exception as e:
+            updater.log(f"获取最新版本失败: {e}", "ERROR", "✗")
+            updater.log_writer.close()
+            sys.exit(1)
+        updater.save_metadata_cache()
+        updater.write_status(state="checked", last_check=datetime.now().strftime("%Y-%m-%d %H:%M:%S"), **result)
+        updater.log(f"当前版本: Docker {Colors.VALUE}{result['current_docker']}{Colors.RESET}, Compose {Colors.VALUE}{result['current_compose']}{Colors.RESET}", "INFO", "")
+        updater.log(f"最新版本: Docker {Colors.VALUE}{result['latest_docker']}{Colors.RESET}, Compose {Colors.VALUE}{result['latest_compose']}{Colors.RESET}", "INFO", "")
+        if result["need_update"]:
+            updater.log(f"需要更新到 {result['latest_docker']}", "NOTICE", "✓")
+        else:
+            updater.log("已是最新版本", "SUCCESS", "✓")
+        updater.set_output('need_update', str(result["need_update"]).lower())
+        updater.set_output('current_version', result["current_docker"] or "none")
+        updater.set_output('latest_version', result["latest_docker"])
+        updater.log_writer.close()
+        sys.exit(0)
+    
+    # 监视模式
+    if args.watch:
+        if args.status_port is not None:
+            updater.start_status_server(args.status_port)
+        try:
+            updater.watch(args.interval)
+        except KeyboardInterrupt:
+            updater.write_status(state="stopped")
+            updater.log("监视模式已退出", "INFO", "👋")
+        updater.log_writer.close()
+        sys.exit(0)
+    
+    # 仅生成下载计划
+    if args.dry_run:
+        if args.dry_run == '-':
+            updater.console = sys.stderr
+        try:
+            plan = updater.build_plan()
+        except UpstreamError as e:
+            updater.log(f"解析下载计划失败: {e}", "ERROR", "✗")
+            updater.log_writer.close()
+            sys.exit(1)
+        updater.save_metadata_cache()
+        plan_json = json.dumps(plan, indent=2, ensure_ascii=False)
+        if args.dry_run == '-':
+            print(plan_json)
+        else:
+            with open(args.dry_run, "w", encoding="utf-8") as f:
+                f.write(plan_json + "\n")
+            updater.log(f"下载计划已保存: {Colors.VALUE}{args.dry_run}{Colors.RESET}", "SUCCESS", "✓")
+        sys.exit(0)
+    
+    plan = None
+    if args.plan:
+        with open(args.plan, "r", encoding="utf-8") as f:
+            plan = json.load(f)
+    
+    # 执行更新；上游不可用时直接失败，而不是回退到写死的版本
+    try:
+        success = updater.update(plan)
+    except UpstreamError as e:
+        updater.log(f"更新失败: {e}", "ERROR", "✗")
+        success = False
+    updater.log_writer.close()
     
     sys.exit(0 if success else 1)
 
@@ -0,0 +1,163 @@
+"""
+update.py 端到端冒烟测试
+复用基准测试中的模拟上游（download.docker.com 与 GitHub API），在临时目录中驱动 DockerUpdater
+"""
+
+import os
+import sys
+import hashlib
+import threading
+import http.client
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "benchmarks"))
+
+import bench_update  # noqa: E402
+from bench_update import update  # noqa: E402
+
+
+SIZES = {"docker": 200 * 1024, "rootless": 100 * 1024, "compose": 150 * 1024}
+
+
+class Upstream:
+    def __init__(self, docker_version, compose_version):
+        self.state = bench_update.UpstreamState(docker_version, compose_version, SIZES, 0, 0, 0, 1)
+        handler = type("Handler", (bench_update.UpstreamHandler,), {"state": self.state})
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.updaters = []
+
+    def run(self, output_dir, **options):
+        options.setdefault("architectures", ["x86_64"])
+        updater = bench_update.make_updater(self.base_url, output_dir, options)
+        self.updaters.append(updater)
+        try:
+            return updater.update(), updater
+        finally:
+            updater.log_writer.close()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        for updater in self.updaters:
+            updater.console.close()
+
+
+@pytest.fixture
+def upstream():
+    server = Upstream("29.1.4", "5.0.1")
+    yield server
+    server.close()
+
+
+def read_checksums(output_dir):
+    with open(output_dir / "SHA256SUMS", "r", encoding="utf-8") as f:
+        return dict(reversed(line.split()) for line in f if line.strip())
+
+
+def assert_checksums_match(output_dir):
+    checksums = read_checksums(output_dir)
+    assert checksums
+    for name, digest in checksums.items():
+        assert hashlib.sha256((output_dir / name).read_bytes()).hexdigest() == digest, name
+
+
+def test_warm_rerun_makes_no_requests(upstream, tmp_path):
+    ok, _ = upstream.run(tmp_path, sync=True)
+    assert ok
+    assert_checksums_match(tmp_path)
+
+    upstream.state.reset()
+    ok, _ = upstream.run(tmp_path, sync=True)
+    assert ok
+    assert upstream.state.requests == {}
+
+
+def test_deltas_survive_noop_rerun(upstream, tmp_path):
+    # 测试数据不可压缩，放宽比例阈值以确保补丁被发布
+    options = {"deltas": True, "delta_max_ratio": 2.0, "cache_ttl": 0}
+    ok, _ = upstream.run(tmp_path, **options)
+    assert ok
+    upstream.state.docker_version = "29.1.5"
+    ok, _ = upstream.run(tmp_path, **options)
+    assert ok
+    deltas = sorted(path.name for path in (tmp_path / "deltas").glob("*.delta"))
+    assert deltas == [
+        "docker-29.1.5-x86_64.tgz.from-29.1.4.delta",
+        "docker-rootless-extras-29.1.5-x86_64.tgz.from-29.1.4.delta",
+    ]
+
+    ok, _ = upstream.run(tmp_path, **options)
+    assert ok
+    assert sorted(path.name for path in (tmp_path / "deltas").glob("*.delta")) == deltas
+    assert sorted(read_checksums(tmp_path / "deltas")) == deltas
+
+
+def test_compose_only_update_can_be_rolled_back(upstream, tmp_path):
+    ok, _ = upstream.run(tmp_path, store=True, cache_ttl=0)
+    assert ok
+    upstream.state.compose_version = "5.0.2"
+    ok, updater = upstream.run(tmp_path, store=True, cache_ttl=0)
+    assert ok
+
+    views = sorted(path.name for path in (tmp_path / ".store" / "views").iterdir() if not path.name.startswith("."))
+    assert len(views) == 2
+    previous = next(view for view in views if "_5.0.1_" in view)
+
+    assert updater.rollback(previous)
+    assert "docker-compose-linux-5.0.1-x86_64" in read_checksums(tmp_path)
+    assert not (tmp_path / "docker-compose-linux-5.0.2-x86_64").exists()
+    assert_checksums_match(tmp_path)
+
+
+def test_serve_range_and_conditional_requests(upstream, tmp_path):
+    ok, _ = upstream.run(tmp_path)
+    assert ok
+    logs = set(tmp_path.glob("update_log_*.txt"))
+    updater = update.DockerUpdater(output_dir=str(tmp_path), write_log=False)
+    updater.console = open(os.devnull, "w")
+    server = updater.start_package_server("127.0.0.1", 0, workers=4)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    name = "docker-compose-linux-5.0.1-x86_64"
+    data = (tmp_path / name).read_bytes()
+
+    def get(headers=None, path=f"/{name}"):
+        conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=10)
+        try:
+            conn.request("GET", path, headers=headers or {})
+            response = conn.getresponse()
+            return response.status, response.headers, response.read()
+        finally:
+            conn.close()
+
+    try:
+        status, headers, body = get()
+        assert (status, body) == (200, data)
+        etag, last_modified = headers["ETag"], headers["Last-Modified"]
+
+        status, headers, body = get({"Range": "bytes=100-199"})
+        assert (status, body) == (206, data[100:200])
+        assert headers["Content-Range"] == f"bytes 100-199/{len(data)}"
+        assert get({"Range": "bytes=-10"})[2] == data[-10:]
+        assert get({"Range": f"bytes={len(data)}-"})[0] == 416
+        # 语法无效的区间被忽略，返回完整内容
+        assert get({"Range": "bytes=500-100"})[:3:2] == (200, data)
+
+        assert get({"Range": "bytes=0-9", "If-Range": etag})[0] == 206
+        assert get({"Range": "bytes=0-9", "If-Range": '"stale"'})[:3:2] == (200, data)
+        assert get({"If-None-Match": etag})[0] == 304
+        assert get({"If-Modified-Since": last_modified})[0] == 304
+
+        assert get(path="/.cache/digests.json")[0] == 404
+        assert get(path="/../README.md")[0] == 404
+        # 分发服务不在发布目录中写入日志文件
+        assert set(tmp_path.glob("update_log_*.txt")) == logs
+    finally:
+        server.shutdown()
+        server.server_close()
+        updater.console.close()